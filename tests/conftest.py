@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -37,3 +39,15 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Кэш страниц не откатывается вместе с базой после теста.
+
+    Поколения сбрасываются после COMMIT, а тесты его не делают, поэтому
+    каждый тест начинает с пустого кэша.
+    """
+    from django.core.cache import cache
+    cache.clear()
+    yield
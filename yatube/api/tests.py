@@ -0,0 +1,80 @@
+import json
+
+from django.test import TestCase
+from django.urls import reverse
+
+from api.views import PAGE_SIZE
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        Post.objects.bulk_create(
+            Post(author=cls.author, text=f'Пост {number}', group=cls.group)
+            for number in range(PAGE_SIZE + 5))
+        cls.post = Post.objects.create(author=cls.author, text='Последний')
+        Comment.objects.create(post=cls.post, author=cls.reader, text='!')
+
+    def get_json(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response['Content-Type'],
+                         'application/json; charset=utf-8')
+        if response.streaming:
+            return json.loads(b''.join(response.streaming_content))
+        return json.loads(response.content)
+
+    def test_feed_is_paged_by_cursor(self):
+        url = reverse('api:posts')
+        first = self.get_json(url)
+        self.assertEqual(len(first['results']), PAGE_SIZE)
+        self.assertEqual(first['results'][0]['text'], 'Последний')
+        second = self.get_json(url, cursor=first['next'])
+        self.assertEqual(len(second['results']), 6)
+        self.assertIsNone(second['next'])
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(len(set(ids)), Post.objects.count())
+
+    def test_sparse_fields(self):
+        data = self.get_json(reverse('api:posts'), fields='id,author',
+                             limit=1)
+        self.assertEqual(data['results'],
+                         [{'id': self.post.pk, 'author': 'author'}])
+
+    def test_bad_parameters(self):
+        url = reverse('api:posts')
+        for params in ({'fields': 'password'}, {'limit': 0},
+                       {'cursor': 'broken'}):
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+
+    def test_scoped_feeds(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+        urls = (
+            reverse('api:group_posts', kwargs={'slug': 'group'}),
+            reverse('api:author_posts', kwargs={'username': 'author'}),
+            reverse('api:follow_posts'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.get_json(url, limit=100)
+                self.assertEqual(len(data['results']),
+                                 PAGE_SIZE + 5 + (url != urls[0]))
+
+    def test_comments(self):
+        data = self.get_json(
+            reverse('api:comments', kwargs={'post_id': self.post.pk}))
+        self.assertEqual(data['results'][0]['author'], 'reader')
+        self.assertEqual(data['results'][0]['post'], self.post.pk)
+
+    def test_errors(self):
+        self.assertEqual(
+            self.client.get(reverse('api:follow_posts')).status_code, 401)
+        self.assertEqual(self.client.get(reverse(
+            'api:group_posts', kwargs={'slug': 'missing'})).status_code, 404)
@@ -0,0 +1,14 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', views.posts, name='posts'),
+    path('groups/<slug>/posts/', views.group_posts, name='group_posts'),
+    path('authors/<str:username>/posts/', views.author_posts,
+         name='author_posts'),
+    path('follow/', views.follow_posts, name='follow_posts'),
+    path('posts/<int:post_id>/comments/', views.comments, name='comments'),
+]
@@ -0,0 +1,163 @@
+"""Read-only JSON API лент для мобильного клиента.
+
+Строки читаются прямо из values(), без объектов моделей, и отдаются
+потоком: память не растёт с размером страницы. Страницы листаются
+курсором ``?cursor=`` по ключу (дата, id), поля выбираются параметром
+``?fields=id,text``, размер страницы — ``?limit=``.
+"""
+import json
+from functools import partial
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from posts.models import Comment, Group, Post, User
+from posts.paginators import NEXT, decode_cursor, encode_key
+from posts.timeline import follow_feed
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 1000
+CHUNK_SIZE = 500
+CONTENT_TYPE = 'application/json; charset=utf-8'
+
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'post': 'post_id',
+    'text': 'text',
+    'created': 'created',
+    'author': 'author__username',
+}
+
+dumps = partial(json.dumps, cls=DjangoJSONEncoder, ensure_ascii=False,
+                separators=(',', ':'))
+
+
+def media_url(name):
+    return settings.MEDIA_URL + name if name else None
+
+
+CONVERTERS = {'image': media_url}
+
+
+def error(status, detail):
+    return JsonResponse({'detail': detail}, status=status,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def selected_fields(request, fields):
+    """Поля из ?fields=, по умолчанию все; неизвестное — ValueError."""
+    names = request.GET.get('fields')
+    if not names:
+        return list(fields)
+    names = names.split(',')
+    unknown = set(names) - set(fields)
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(sorted(unknown))}.')
+    return names
+
+
+def page_size(request):
+    limit = request.GET.get('limit')
+    if limit is None:
+        return PAGE_SIZE
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError('limit должен быть числом.')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit должен быть от 1 до {MAX_PAGE_SIZE}.')
+    return limit
+
+
+def feed(request, rows, fields, date_field):
+    """Страница ленты потоком JSON: {"results": [...], "next": курсор}."""
+    try:
+        names = selected_fields(request, fields)
+        limit = page_size(request)
+    except ValueError as exc:
+        return error(400, str(exc))
+    token = request.GET.get('cursor')
+    if token:
+        cursor = decode_cursor(token)
+        if cursor is None or cursor[0] != NEXT:
+            return error(400, 'Неверный курсор.')
+        direction, date, pk = cursor
+        rows = rows.filter(Q(**{f'{date_field}__lt': date})
+                           | Q(**{date_field: date, 'pk__lt': pk}))
+    lookups = {fields[name] for name in names} | {date_field, 'id'}
+    rows = (rows
+            .order_by(f'-{date_field}', '-id')
+            .values(*lookups)[:limit + 1])
+    return StreamingHttpResponse(
+        stream(rows, names, fields, limit, date_field),
+        content_type=CONTENT_TYPE)
+
+
+def stream(rows, names, fields, limit, date_field):
+    yield '{"results":['
+    count, last, has_more = 0, None, False
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        if count == limit:
+            has_more = True
+            break
+        item = {}
+        for name in names:
+            value = row[fields[name]]
+            convert = CONVERTERS.get(name)
+            item[name] = convert(value) if convert else value
+        yield (',' if count else '') + dumps(item)
+        count, last = count + 1, row
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_key(NEXT, last[date_field], last['id'])
+    yield '],"next":' + dumps(next_cursor) + '}'
+
+
+@require_GET
+def posts(request):
+    return feed(request, Post.objects.all(), POST_FIELDS, 'pub_date')
+
+
+@require_GET
+def group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).first()
+    if group is None:
+        return error(404, 'Группа не найдена.')
+    return feed(request, Post.objects.filter(group=group),
+                POST_FIELDS, 'pub_date')
+
+
+@require_GET
+def author_posts(request, username):
+    author = User.objects.filter(username=username).first()
+    if author is None:
+        return error(404, 'Автор не найден.')
+    return feed(request, Post.objects.filter(author=author),
+                POST_FIELDS, 'pub_date')
+
+
+@require_GET
+def follow_posts(request):
+    if not request.user.is_authenticated:
+        return error(401, 'Нужна авторизация.')
+    return feed(request, follow_feed(request.user),
+                POST_FIELDS, 'feed_date')
+
+
+@require_GET
+def comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        return error(404, 'Пост не найден.')
+    return feed(request, Comment.objects.filter(post_id=post_id),
+                COMMENT_FIELDS, 'created')
@@ -0,0 +1,333 @@
+"""Двухуровневый кэш: LRU в памяти процесса поверх общего SQLite-файла.
+
+Подключается через ``settings.CACHES``::
+
+    'BACKEND': 'core.cache.TwoTierCache',
+    'LOCATION': '/path/to/cache.sqlite3',
+    'OPTIONS': {'L1_MAX_ENTRIES': 1000, 'SYNC_INTERVAL': 0.5},
+
+Второй уровень (``SQLiteCache``) общий для всех процессов, которые
+смотрят в один файл. Каждая запись и удаление попадают в журнал
+той же транзакцией; процессы читают журнал не чаще SYNC_INTERVAL
+секунд и выкидывают из своего первого уровня изменённые ключи.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+CLEAR_ALL = '*'
+JOURNAL_LENGTH = 10000
+CHUNK_SIZE = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL
+);
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    origin INTEGER NOT NULL
+);
+'''
+
+
+def relocated(caches, directory):
+    """Копия настроек CACHES, в которой файлы кэшей лежат в directory.
+
+    Тесты и замеры работают с таким кэшем, чтобы не читать и не
+    засорять кэш сайта.
+    """
+    caches = {alias: dict(params) for alias, params in caches.items()}
+    for params in caches.values():
+        if params.get('LOCATION'):
+            params['LOCATION'] = os.path.join(
+                directory, os.path.basename(params['LOCATION']))
+    return caches
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в SQLite-файле, общий для процессов одной машины."""
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        self._local = threading.local()
+
+    @property
+    def origin(self):
+        """Процесс, от имени которого пишется журнал."""
+        return os.getpid()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.location, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+            connection.execute('COMMIT')
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self.transaction() as connection:
+            if self._fetch(connection, [key]):
+                return False
+            self._store(connection, {key: self._dumps(value)},
+                        self.get_backend_timeout(timeout))
+        return True
+
+    def get(self, key, default=None, version=None):
+        found = self.get_many([key], version=version)
+        return found.get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_key(key, version=version): key for key in keys}
+        for key in keys:
+            self.validate_key(key)
+        found = self._fetch(self.connection, list(keys))
+        return {keys[key]: pickle.loads(value)
+                for key, (value, expires) in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        values = {}
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            values[key] = self._dumps(value)
+        with self.transaction() as connection:
+            self._store(connection, values, self.get_backend_timeout(timeout))
+            self._cull(connection)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self.transaction() as connection:
+            found = self._fetch(connection, [key])
+            if key in found:
+                self._store(connection, {key: found[key][0]},
+                            self.get_backend_timeout(timeout))
+        return key in found
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        with self.transaction() as connection:
+            self._remove(connection, keys)
+
+    def has_key(self, key, version=None):
+        return key in self.get_many([key], version=version)
+
+    def clear(self):
+        with self.transaction() as connection:
+            connection.execute('DELETE FROM cache')
+            self._journal(connection, [CLEAR_ALL])
+
+    def changes_since(self, seq):
+        """Ключи, изменённые другими процессами после записи журнала seq.
+
+        Возвращает (последний seq, ключи). Если журнал уже обрезан дальше
+        seq, вместо ключей возвращается CLEAR_ALL.
+        """
+        connection = self.connection
+        first, last = connection.execute(
+            'SELECT MIN(seq), MAX(seq) FROM journal').fetchone()
+        if last is None or last <= seq:
+            return seq, set()
+        if first > seq + 1:
+            return last, {CLEAR_ALL}
+        keys = {key for key, in connection.execute(
+            'SELECT key FROM journal WHERE seq > ? AND seq <= ?'
+            ' AND origin != ?', (seq, last, self.origin))}
+        return last, keys
+
+    def find_keys(self, prefix, version=None):
+        """Ключи, начинающиеся с prefix, без префикса версии."""
+        start = self.make_key('', version=version)
+        pattern = (start + prefix).replace('\\', '\\\\')
+        pattern = pattern.replace('%', '\\%').replace('_', '\\_')
+        rows = self.connection.execute(
+            "SELECT key FROM cache WHERE key LIKE ? ESCAPE '\\'"
+            ' AND (expires IS NULL OR expires > ?)',
+            (pattern + '%', time.time()))
+        return [key[len(start):] for key, in rows]
+
+    def _dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _fetch(self, connection, keys):
+        """Живые записи: {ключ: (pickle-значение, срок)}."""
+        found = {}
+        now = time.time()
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            rows = connection.execute(
+                'SELECT key, value, expires FROM cache WHERE key IN (%s)'
+                % ', '.join('?' * len(chunk)), chunk)
+            for key, value, expires in rows:
+                if expires is None or expires > now:
+                    found[key] = (value, expires)
+        return found
+
+    def _store(self, connection, values, expires):
+        connection.executemany(
+            'INSERT OR REPLACE INTO cache (key, value, expires)'
+            ' VALUES (?, ?, ?)',
+            [(key, value, expires) for key, value in values.items()])
+        self._journal(connection, values)
+
+    def _remove(self, connection, keys):
+        connection.executemany(
+            'DELETE FROM cache WHERE key = ?', [(key,) for key in keys])
+        self._journal(connection, keys)
+
+    def _journal(self, connection, keys):
+        connection.executemany(
+            'INSERT INTO journal (key, origin) VALUES (?, ?)',
+            [(key, self.origin) for key in keys])
+
+    def _cull(self, connection):
+        connection.execute(
+            'DELETE FROM journal WHERE seq <='
+            ' (SELECT MAX(seq) FROM journal) - ?', (JOURNAL_LENGTH,))
+        total, = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if total <= self._max_entries:
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        connection.execute(
+            'DELETE FROM cache WHERE rowid IN'
+            ' (SELECT rowid FROM cache ORDER BY rowid LIMIT ?)',
+            (total // self._cull_frequency,))
+
+
+# Первый уровень общий для всех потоков процесса: Django создаёт
+# по экземпляру бэкенда на поток.
+_memory = {}
+_locks = {}
+_synced = {}
+
+
+class TwoTierCache(SQLiteCache):
+    """SQLiteCache с ограниченным LRU-кэшем процесса перед ним."""
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        options = params.get('OPTIONS', {})
+        self._l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self._sync_interval = float(options.get('SYNC_INTERVAL', 0.5))
+        self._memory = _memory.setdefault(location, OrderedDict())
+        self._lock = _locks.setdefault(location, threading.Lock())
+        if location not in _synced:
+            _synced[location] = (self.changes_since(0)[0], time.monotonic())
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        keys = {self.make_key(key, version=version): key for key in keys}
+        now = time.time()
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is not None and (entry[1] is None or entry[1] > now):
+                    self._memory.move_to_end(key)
+                    found[key] = entry
+                else:
+                    missing.append(key)
+        if missing:
+            for key in missing:
+                self.validate_key(key)
+            fetched = self._fetch(self.connection, missing)
+            self._remember(fetched)
+            found.update(fetched)
+        return {keys[key]: pickle.loads(value)
+                for key, (value, expires) in found.items()}
+
+    @contextmanager
+    def transaction(self):
+        """Записи и удаления попадают в память только после COMMIT.
+
+        Иначе при неудачном COMMIT в памяти осталось бы значение, которого
+        нет в общем файле, до следующей сверки с журналом.
+        """
+        self._local.written = written = {}
+        try:
+            with super().transaction() as connection:
+                yield connection
+        finally:
+            self._local.written = None
+        self._remember({key: entry for key, entry in written.items()
+                        if entry is not None})
+        self._forget([key for key, entry in written.items()
+                      if entry is None])
+
+    def clear(self):
+        super().clear()
+        self._forget([CLEAR_ALL])
+
+    def _store(self, connection, values, expires):
+        super()._store(connection, values, expires)
+        self._local.written.update(
+            (key, (value, expires)) for key, value in values.items())
+
+    def _remove(self, connection, keys):
+        super()._remove(connection, keys)
+        self._local.written.update(dict.fromkeys(keys))
+
+    def _remember(self, entries):
+        with self._lock:
+            for key, entry in entries.items():
+                self._memory[key] = entry
+                self._memory.move_to_end(key)
+            while len(self._memory) > self._l1_max_entries:
+                self._memory.popitem(last=False)
+
+    def _forget(self, keys):
+        with self._lock:
+            if CLEAR_ALL in keys:
+                self._memory.clear()
+                return
+            for key in keys:
+                self._memory.pop(key, None)
+
+    def _sync(self):
+        """Выкидывает из памяти ключи, изменённые другими процессами."""
+        seq, synced_at = _synced[self.location]
+        if time.monotonic() - synced_at < self._sync_interval:
+            return
+        seq, keys = self.changes_since(seq)
+        _synced[self.location] = (seq, time.monotonic())
+        if keys:
+            self._forget(keys)
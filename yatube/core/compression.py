@@ -0,0 +1,63 @@
+"""Сжатие ответов gzip с учётом Accept-Encoding и GZIP_LEVEL.
+
+``compress_string`` и ``compress_sequence`` — как одноимённые функции
+Django, но с уровнем GZIP_LEVEL вместо зашитого 6.
+``compress_sequence`` после каждого куска делает ``Z_SYNC_FLUSH``:
+клиент получает страницу по мере рендера, а тело целиком в памяти
+не собирается.
+"""
+import zlib
+
+from django.conf import settings
+
+# 16 + окно 32 КБ: zlib пишет заголовок и хвост gzip.
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript',
+                      'application/xml', 'image/svg+xml')
+COMPRESSIBLE_SUFFIXES = ('+json', '+xml')
+
+
+def accepted_codings(header):
+    """{кодировка: q} из заголовка Accept-Encoding."""
+    codings = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding.lower()] = quality
+    return codings
+
+
+def accepts_gzip(request):
+    codings = accepted_codings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    return codings.get('gzip', codings.get('*', 0)) > 0
+
+
+def is_compressible(content_type):
+    content_type = content_type.split(';')[0].strip().lower()
+    return (content_type.startswith(COMPRESSIBLE_TYPES)
+            or content_type.endswith(COMPRESSIBLE_SUFFIXES))
+
+
+def compress_string(data):
+    compressor = zlib.compressobj(
+        settings.GZIP_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_sequence(chunks):
+    compressor = zlib.compressobj(
+        settings.GZIP_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
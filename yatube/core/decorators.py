@@ -0,0 +1,105 @@
+from datetime import datetime, timezone
+from functools import wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.views.decorators.http import condition
+
+from . import generations
+
+
+def page_versions(request, get_scopes, *args, **kwargs):
+    """Поколения областей страницы по порядку, None — не кэшируется.
+
+    Считаются один раз на запрос, сколько бы декораторов их ни спросили.
+    """
+    if not hasattr(request, '_page_versions'):
+        scopes = get_scopes(*args, **kwargs)
+        versions = None
+        if scopes is not None:
+            found = generations.get_many(scopes)
+            versions = [found[scope] for scope in scopes]
+        request._page_versions = versions
+    return request._page_versions
+
+
+def page_query(request, params):
+    """Параметры запроса для ключа кэша или None, если кэшировать нельзя.
+
+    Кэшируются только страницы с параметрами, которые читает вьюха, и
+    с допустимыми значениями: иначе любой клиент заводил бы в кэше
+    сколько угодно вечных записей, дописывая к адресу ``?x=1``.
+    """
+    if not set(request.GET) <= set(params):
+        return None
+    query = []
+    for name, is_valid in params.items():
+        values = request.GET.getlist(name)
+        if len(values) > 1 or values and not is_valid(values[0]):
+            return None
+        query += [f'{name}={value}' for value in values]
+    return '&'.join(query)
+
+
+def cache_anonymous_page(get_scopes, params=None):
+    """Кэширует страницу для анонимов, пока не сменятся её поколения.
+
+    get_scopes получает аргументы вьюхи и возвращает области кэша,
+    от которых зависит страница, или None, если кэшировать не нужно.
+    params — {параметр запроса: проверка значения}, которые читает
+    вьюха; страница с другими параметрами не кэшируется.
+    """
+    params = params or {}
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            query = page_query(request, params)
+            if query is None:
+                return view(request, *args, **kwargs)
+            versions = page_versions(request, get_scopes, *args, **kwargs)
+            if versions is None:
+                return view(request, *args, **kwargs)
+            path = md5(f'{request.path}?{query}'.encode()).hexdigest()
+            key = ':'.join(['page', path] + [str(v) for v in versions])
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200:
+                    cache.set(key, response, settings.PAGE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_page(get_scopes):
+    """ETag и Last-Modified из поколений страницы: повтор получает 304.
+
+    Поколение — время последнего сброса области, поэтому самое новое
+    из них и есть время изменения страницы. Авторизованным страница
+    своя, поэтому их ETag включает пользователя и CSRF-куку формы,
+    а Last-Modified им не отдаётся.
+    """
+    def etag(request, *args, **kwargs):
+        versions = page_versions(request, get_scopes, *args, **kwargs)
+        if versions is None:
+            return None
+        owner = ['anon']
+        if request.user.is_authenticated:
+            owner = [str(request.user.pk),
+                     request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')]
+        raw = ':'.join(owner + [str(v) for v in versions])
+        return md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return None
+        versions = page_versions(request, get_scopes, *args, **kwargs)
+        if not versions:
+            return None
+        return datetime.fromtimestamp(max(versions) / 1e9, timezone.utc)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
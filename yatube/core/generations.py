@@ -0,0 +1,35 @@
+from time import time_ns
+
+from django.core.cache import cache
+from django.db import transaction
+
+PREFIX = 'generation:'
+
+
+def get_many(scopes):
+    """Текущие поколения областей кэша, недостающие заводятся заново.
+
+    Новое поколение — это время в наносекундах, а не счётчик с нуля:
+    поколение, вытесненное из кэша, не совпадёт со старыми ключами.
+    """
+    keys = {PREFIX + scope: scope for scope in scopes}
+    found = cache.get_many(list(keys))
+    missing = {key: time_ns() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {keys[key]: value for key, value in found.items()}
+
+
+def bump(*scopes):
+    """Начинает новое поколение: старые ключи областей больше не читаются."""
+    cache.set_many({PREFIX + scope: time_ns() for scope in scopes}, None)
+
+
+def bump_on_commit(*scopes):
+    """bump после COMMIT текущей транзакции, без неё — сразу.
+
+    До COMMIT другие запросы читают из базы старые строки: поколение,
+    сброшенное раньше, они заняли бы страницей со старыми данными.
+    """
+    transaction.on_commit(lambda: bump(*scopes))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.warmup import warmup
+
+
+class Command(BaseCommand):
+    help = ('Компилирует шаблоны, собирает URL и настраивает sorl-thumbnail. '
+            'Воркеры делают то же из wsgi.py; команда показывает, '
+            'сколько это стоит, и падает на битых шаблонах.')
+
+    def handle(self, *args, **options):
+        stats = warmup()
+        self.stdout.write(
+            f'Шаблонов: {stats["templates"]}, URL: {stats["urls"]}, '
+            f'sorl: {", ".join(stats["sorl"])}, '
+            f'{stats["seconds"]:.2f} с')
+        if stats['errors']:
+            raise CommandError('Шаблоны с ошибками:\n'
+                               + '\n'.join(stats['errors']))
+        self.stdout.write(self.style.SUCCESS('Процесс прогрет.'))
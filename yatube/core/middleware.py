@@ -0,0 +1,193 @@
+import mimetypes
+import os
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.middleware import gzip
+from django.template.loader import render_to_string
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from . import compression, queries, timing
+from .staticfiles import IMMUTABLE, is_hashed
+
+PANEL_PARAM = 'timing'
+BODY_END = b'</body>'
+
+
+class StaticFilesMiddleware:
+    """Отдаёт собранную статику из STATIC_ROOT до остальных middleware.
+
+    Файлы с хешем в имени кэшируются клиентом навсегда, остальные —
+    на STATIC_MAX_AGE секунд с проверкой по Last-Modified. Если рядом
+    лежит ``.gz`` и клиент понимает gzip, отдаётся сжатая копия.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVE_STATIC:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+
+    def __call__(self, request):
+        if (request.method in ('GET', 'HEAD')
+                and request.path_info.startswith(self.prefix)):
+            response = self.serve(request,
+                                  request.path_info[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                                  stat.st_mtime, stat.st_size):
+            return HttpResponseNotModified()
+        content_type = mimetypes.guess_type(path)[0]
+        encoding = None
+        if (compression.accepts_gzip(request)
+                and os.path.isfile(path + '.gz')):
+            path, encoding = path + '.gz', 'gzip'
+        response = FileResponse(
+            open(path, 'rb'),
+            content_type=content_type or 'application/octet-stream')
+        if response.has_header('Content-Disposition'):
+            del response['Content-Disposition']
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Vary'] = 'Accept-Encoding'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = (
+            IMMUTABLE if is_hashed(name)
+            else f'public, max-age={settings.STATIC_MAX_AGE}')
+        return response
+
+
+def server_timing(summary):
+    metrics = []
+    for name, label, seconds, count in summary:
+        description = label if count is None else f'{label} x{count}'
+        metrics.append(f'{name};dur={seconds * 1000:.1f};desc="{description}"')
+    return ', '.join(metrics)
+
+
+class GZipMiddleware(gzip.GZipMiddleware):
+    """GZipMiddleware Django с уровнем GZIP_LEVEL и потоковым сжатием.
+
+    Сжатие — core.compression: уровень из настроек, поток отдаётся
+    кусками по мере рендера. Вдобавок не сжимаются нетекстовые ответы —
+    картинки и архивы уже сжаты — и клиенты с ``gzip;q=0``.
+    ``GZIP_LEVEL = 0`` отключает middleware.
+    """
+
+    def __init__(self, get_response=None):
+        if not settings.GZIP_LEVEL:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_response(self, request, response):
+        if (not response.streaming
+                and len(response.content) < settings.GZIP_MIN_LENGTH):
+            return response
+        if (response.has_header('Content-Encoding')
+                or not compression.is_compressible(
+                    response.get('Content-Type', ''))):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not compression.accepts_gzip(request):
+            return response
+
+        if response.streaming:
+            response.streaming_content = compression.compress_sequence(
+                response.streaming_content)
+            del response['Content-Length']
+        else:
+            compressed = compression.compress_string(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # Сжатое тело не совпадает байт в байт с исходным.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = 'gzip'
+        return response
+
+
+class ServerTimingMiddleware:
+    """Заголовок Server-Timing с временем SQL, шаблонов, кэша и миниатюр.
+
+    Сотрудникам с ``?timing=1`` в конце страницы показывается та же
+    разбивка таблицей. С ``SERVER_TIMING = False`` middleware
+    отключается целиком и ничего не оборачивает.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        timing.instrument()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with timing.measure() as timings:
+            response = self.get_response(request)
+        summary = timings.summary()
+        response['Server-Timing'] = server_timing(summary)
+        if self.wants_panel(request, response):
+            self.add_panel(response, summary)
+        return response
+
+    def wants_panel(self, request, response):
+        user = getattr(request, 'user', None)
+        return (request.GET.get(PANEL_PARAM)
+                and user is not None and user.is_staff
+                and not response.streaming
+                and response.status_code == 200
+                and response.get('Content-Type', '').startswith('text/html'))
+
+    def add_panel(self, response, summary):
+        total = summary[-1][2] or 1
+        rows = [{'name': name, 'label': label, 'count': count,
+                 'ms': seconds * 1000, 'share': seconds / total * 100}
+                for name, label, seconds, count in summary]
+        panel = render_to_string('core/timing_panel.html', {'rows': rows})
+        content = response.content
+        index = content.rfind(BODY_END)
+        if index == -1:
+            index = len(content)
+        response.content = (content[:index] + panel.encode(response.charset)
+                            + content[index:])
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = str(len(response.content))
+
+
+class QueryInspectorMiddleware:
+    """Лог медленных запросов и подозрений на N+1 (см. core.queries).
+
+    Медленные запросы пишутся при SLOW_QUERY_LOG, N+1 ищется при
+    QUERY_INSPECTOR.
+    """
+
+    def __init__(self, get_response):
+        if not (settings.SLOW_QUERY_LOG or settings.QUERY_INSPECTOR):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inspector = queries.Inspector(
+            request, nplusone=settings.QUERY_INSPECTOR)
+        with inspector.watch():
+            response = self.get_response(request)
+        inspector.report()
+        return response
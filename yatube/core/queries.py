@@ -0,0 +1,139 @@
+"""Медленные запросы и подозрения на N+1 в пределах одного запроса.
+
+Каждый SQL-запрос сводится к отпечатку: литералы заменяются на ``?``,
+списки ``IN (...)`` схлопываются. Если запрос с одним отпечатком
+выполнился ``NPLUSONE_LIMIT`` раз из одного места — строки шаблона
+или кода проекта, — это подозрение на N+1: оно пишется в лог, а
+в строгом режиме (``NPLUSONE_STRICT``, он включён в тестах)
+поднимает ``NPlusOneError``.
+
+Запросы дольше ``SLOW_QUERY_MS`` пишутся в лог ``core.queries.slow``
+с представлением, местом и стеком вызовов проекта, если включён
+``SLOW_QUERY_LOG``. Без поиска N+1 место ищется только для медленных
+запросов, остальные стоят одного замера времени.
+"""
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Node
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger(__name__ + '.slow')
+
+IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)')
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+RENDER_CODE = Node.render_annotated.__code__
+PROJECT_DIR = settings.BASE_DIR + os.sep
+CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Обёртки замеров стоят в стеке каждого запроса, место они не выдают.
+SKIPPED_FILES = {os.path.join(CORE_DIR, name)
+                 for name in ('queries.py', 'timing.py', 'middleware.py')}
+STACK_DEPTH = 10
+
+
+class NPlusOneError(AssertionError):
+    """Один и тот же запрос повторяется из одного места."""
+
+
+def fingerprint(sql):
+    """Форма запроса без конкретных значений."""
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return ' '.join(LITERAL_RE.sub('?', sql).split())
+
+
+def is_project_file(filename):
+    return (filename.startswith(PROJECT_DIR)
+            and filename not in SKIPPED_FILES
+            and 'site-packages' not in filename)
+
+
+def origin(frame):
+    """Место запроса: строка шаблона, если он из шаблона, и стек проекта.
+
+    Возвращает (место, [строки стека]) — стек от вызова к корню.
+    """
+    template, stack = None, []
+    while frame is not None and len(stack) < STACK_DEPTH:
+        if template is None and frame.f_code is RENDER_CODE:
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            if token is not None and node.origin is not None:
+                name = node.origin.template_name or node.origin.name
+                template = f'{name}:{token.lineno}'
+        filename = frame.f_code.co_filename
+        if is_project_file(filename):
+            stack.append(f'{os.path.relpath(filename, settings.BASE_DIR)}:'
+                         f'{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return template or (stack[0] if stack else '?'), stack
+
+
+class Inspector:
+    """Отпечатки запросов одного HTTP-запроса или блока кода.
+
+    С nplusone=False отпечатки не собираются, только лог медленных.
+    """
+
+    def __init__(self, request=None, nplusone=True):
+        self.request = request
+        self.nplusone = nplusone
+        self.slow_ms = (settings.SLOW_QUERY_MS if settings.SLOW_QUERY_LOG
+                        else None)
+        self.repeats = Counter()
+
+    @property
+    def where(self):
+        """Представление и путь запроса, если они известны."""
+        if self.request is None:
+            return 'вне запроса'
+        path = f'{self.request.method} {self.request.path}'
+        match = getattr(self.request, 'resolver_match', None)
+        return f'{match.view_name} ({path})' if match else path
+
+    @contextmanager
+    def watch(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.execute))
+            yield self
+
+    def execute(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (perf_counter() - started) * 1000
+            slow = self.slow_ms is not None and elapsed >= self.slow_ms
+            if self.nplusone or slow:
+                place, stack = origin(sys._getframe(1))
+            if self.nplusone:
+                self.repeats[(fingerprint(sql), place)] += 1
+            if slow:
+                slow_logger.warning(
+                    'Медленный запрос %.1f мс в %s из %s: %s %r\n%s',
+                    elapsed, self.where, place, sql, params,
+                    '\n'.join(stack))
+
+    def suspects(self):
+        """[(место, число повторов, отпечаток)] подозрений на N+1."""
+        return [(place, count, shape)
+                for (shape, place), count in self.repeats.items()
+                if count >= settings.NPLUSONE_LIMIT]
+
+    def report(self):
+        """Пишет подозрения в лог; в строгом режиме — исключение."""
+        suspects = self.suspects()
+        for place, count, shape in suspects:
+            logger.warning('Возможный N+1 в %s: %d раз из %s: %s',
+                           self.where, count, place, shape)
+        if suspects and settings.NPLUSONE_STRICT:
+            raise NPlusOneError('\n'.join(
+                f'{self.where}: {count} раз из {place}: {shape}'
+                for place, count, shape in suspects))
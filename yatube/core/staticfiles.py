@@ -0,0 +1,46 @@
+"""Статика с хешем в имени и заранее сжатыми копиями.
+
+``collectstatic`` с ``CompressedManifestStaticFilesStorage`` пишет,
+кроме исходников, копии с хешем содержимого в имени (манифест
+``staticfiles.json``) и рядом с текстовыми файлами — ``.gz``, если
+сжатие заметно уменьшает файл. Отдаёт их ``StaticFilesMiddleware``.
+"""
+import gzip
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.xml',
+                '.html', '.ico')
+# Сжатая копия, которая экономит меньше 5%, не стоит лишнего файла.
+MIN_RATIO = 0.95
+IMMUTABLE = 'public, max-age=31536000, immutable'
+HASHED_RE = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+
+def is_hashed(name):
+    """Имя с хешем содержимого: такой файл никогда не меняется."""
+    return bool(HASHED_RE.search(name))
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Файл, которого нет в манифесте, ссылается на имя без хеша (404
+    # на одну картинку), а не роняет в 500 каждую страницу с ним.
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in paths:
+            if name.endswith(COMPRESSIBLE):
+                for target in {name, self.stored_name(name)}:
+                    self.compress(target)
+
+    def compress(self, name):
+        with self.open(name) as source:
+            data = source.read()
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data) * MIN_RATIO:
+            with open(self.path(name) + '.gz', 'wb') as target:
+                target.write(compressed)
@@ -1,6 +1,26 @@
+import gzip
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import zlib
 from http import HTTPStatus
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template import Context, Template, engines
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from core import compression, queries, staticfiles, timing, warmup
+from core.cache import TwoTierCache
+from core.middleware import GZipMiddleware
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +28,352 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+def set_in_other_process(location, key, value):
+    TwoTierCache(location, {}).set(key, value)
+
+
+class TwoTierCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = TwoTierCache(
+            self.location, {'OPTIONS': {'SYNC_INTERVAL': 0}})
+
+    def test_values_roundtrip(self):
+        self.cache.set_many({'a': 1, 'b': [2]}, None)
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': [2]})
+        self.cache.delete('a')
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('expired', 1, timeout=0)
+        self.assertIsNone(self.cache.get('expired'))
+
+    def test_write_in_other_process_invalidates_memory(self):
+        self.cache.set('key', 'old')
+        self.assertEqual(self.cache.get('key'), 'old')
+        process = multiprocessing.get_context('spawn').Process(
+            target=set_in_other_process, args=(self.location, 'key', 'new'))
+        process.start()
+        process.join()
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_failed_write_leaves_memory_untouched(self):
+        self.cache.set('key', 'old')
+        with mock.patch.object(self.cache, '_cull',
+                               side_effect=sqlite3.OperationalError):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.cache.set('key', 'new')
+        self.assertEqual(self.cache.get('key'), 'old')
+        self.assertFalse(self.cache.connection.in_transaction)
+
+    def test_find_keys_by_prefix(self):
+        self.cache.set_many({'thumb||a': 1, 'thumb||b': 2, 'thumbs': 3})
+        self.cache.set('thumb||expired', 4, timeout=0)
+        self.assertCountEqual(self.cache.find_keys('thumb||'),
+                              ['thumb||a', 'thumb||b'])
+
+
+class TestEnvironmentTest(TestCase):
+    def test_cache_and_strict_mode(self):
+        """Тесты пишут кэш во временный каталог и падают на N+1."""
+        location = settings.CACHES['default']['LOCATION']
+        self.assertEqual(os.path.dirname(location), settings.TEST_CACHE_DIR)
+        self.assertTrue(settings.NPLUSONE_STRICT)
+
+
+class ServerTimingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Модели берутся при вызове: модуль импортирует и дочерний
+        # процесс TwoTierCacheTest, где приложения не загружены.
+        User = get_user_model()
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        cls.user = User.objects.create_user(username='user')
+
+    def setUp(self):
+        cache.clear()
+
+    def metrics(self, response):
+        return {metric.split(';')[0]: metric
+                for metric in response['Server-Timing'].split(', ')}
+
+    def test_header_has_phases(self):
+        """Заголовок разбивает время на SQL, шаблоны, кэш и остаток."""
+        metrics = self.metrics(self.client.get(reverse('posts:index')))
+        self.assertTrue({'db', 'template', 'cache', 'app', 'total'}
+                        <= set(metrics))
+        self.assertRegex(metrics['db'], r'^db;dur=[\d.]+;desc="SQL x\d+"$')
+
+    def test_phases_do_not_overlap(self):
+        """Сумма фаз не больше общего времени."""
+        timings = timing.Timings()
+        with timings.phase('template'):
+            with timings.phase('db'):
+                pass
+            with timings.phase('template'):
+                pass
+        rows = timings.summary()
+        self.assertEqual(timings.counts['template'], 1)
+        self.assertEqual(timings.counts['db'], 1)
+        self.assertAlmostEqual(sum(row[2] for row in rows[:-1]), rows[-1][2])
+
+    def test_panel_for_staff_only(self):
+        """Таблица фаз — только сотрудникам и только по ?timing=1."""
+        url = reverse('posts:index')
+        self.client.force_login(self.user)
+        self.assertNotContains(self.client.get(url, {'timing': 1}),
+                               'server-timing')
+        self.client.force_login(self.staff)
+        self.assertNotContains(self.client.get(url), 'server-timing')
+        response = self.client.get(url, {'timing': 1})
+        self.assertContains(response, 'id="server-timing"')
+        self.assertLess(response.content.index(b'server-timing'),
+                        response.content.index(b'</body>'))
+
+    @override_settings(SERVER_TIMING=False)
+    def test_disabled(self):
+        """Выключенный замер не добавляет заголовок."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class QueryInspectorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = [User.objects.create_user(username=f'user{number}')
+                     for number in range(settings.NPLUSONE_LIMIT)]
+
+    def test_fingerprint(self):
+        """Отпечаток не зависит от значений и длины списка IN."""
+        self.assertEqual(
+            queries.fingerprint("SELECT a FROM t WHERE id = 5 AND s = 'x'"),
+            queries.fingerprint("SELECT a FROM t WHERE id = 7 AND s = 'y'"))
+        self.assertEqual(
+            queries.fingerprint('SELECT a FROM t WHERE id IN (%s, %s)'),
+            queries.fingerprint('SELECT a FROM t WHERE id IN (%s)'))
+
+    def test_loop_in_template_is_suspect(self):
+        """Запрос в цикле шаблона — подозрение с местом в шаблоне."""
+        template = Template(
+            '{% for user in users %}\n{{ user.groups.count }}{% endfor %}')
+        inspector = queries.Inspector()
+        with inspector.watch():
+            template.render(Context({'users': self.users}))
+        [(place, count, shape)] = inspector.suspects()
+        self.assertTrue(place.endswith(':2'))
+        self.assertEqual(count, len(self.users))
+        with self.assertLogs('core.queries', 'WARNING'):
+            with self.assertRaises(queries.NPlusOneError):
+                inspector.report()
+
+    @override_settings(NPLUSONE_STRICT=False)
+    def test_loop_in_code_is_logged(self):
+        """Вне строгого режима подозрение только пишется в лог."""
+        User = get_user_model()
+        inspector = queries.Inspector()
+        with inspector.watch():
+            for user in self.users:
+                User.objects.get(pk=user.pk)
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            inspector.report()
+        self.assertIn('core/tests.py', logs.output[0])
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_query_log(self):
+        """Медленные запросы пишутся с представлением и стеком."""
+        with self.assertLogs('core.queries.slow', 'WARNING') as logs:
+            self.client.get(reverse('about:author'))
+            self.client.get(reverse('posts:index'))
+        self.assertIn('posts:index', ''.join(logs.output))
+
+    @override_settings(QUERY_INSPECTOR=False, SLOW_QUERY_MS=0)
+    def test_slow_query_log_without_nplusone(self):
+        """Без поиска N+1 лог медленных запросов всё равно пишется."""
+        with self.assertLogs('core.queries.slow', 'WARNING'):
+            self.client.get(reverse('posts:index'))
+
+    def test_fast_queries_skip_origin(self):
+        """Без поиска N+1 место быстрого запроса не ищется."""
+        User = get_user_model()
+        inspector = queries.Inspector(nplusone=False)
+        with mock.patch('core.queries.origin') as origin:
+            with inspector.watch():
+                User.objects.count()
+        origin.assert_not_called()
+        self.assertEqual(inspector.suspects(), [])
+
+
+CACHED_TEMPLATES = [{
+    **settings.TEMPLATES[0],
+    'OPTIONS': {
+        **settings.TEMPLATES[0]['OPTIONS'],
+        'loaders': [('django.template.loaders.cached.Loader',
+                     settings.TEMPLATE_LOADERS)],
+    },
+}]
+
+
+class WarmupTest(TestCase):
+    def test_command(self):
+        """Команда компилирует шаблоны проекта без ошибок."""
+        out = StringIO()
+        call_command('warmup', stdout=out)
+        self.assertIn('Процесс прогрет', out.getvalue())
+
+    @override_settings(TEMPLATES=CACHED_TEMPLATES)
+    def test_fills_cached_loader(self):
+        """После прогрева шаблоны уже лежат в кэше загрузчика."""
+        stats = warmup.warmup()
+        loader = engines['django'].engine.template_loaders[0]
+        for name in ('posts/index.html', 'posts/includes/paginator.html'):
+            self.assertIn(name, loader.get_template_cache)
+        self.assertEqual(stats['errors'], [])
+        self.assertGreater(stats['urls'], 0)
+
+
+class StaticFilesTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        storage = 'core.staticfiles.CompressedManifestStaticFilesStorage'
+        with override_settings(STATIC_ROOT=self.root,
+                               STATICFILES_STORAGE=storage):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.root, 'staticfiles.json')) as stream:
+            self.hashed = json.load(stream)['paths']['css/bootstrap.min.css']
+
+    def test_collectstatic_writes_hashed_and_gzipped_copies(self):
+        """collectstatic пишет имя с хешем и .gz рядом с ним."""
+        self.assertTrue(staticfiles.is_hashed(self.hashed))
+        path = os.path.join(self.root, self.hashed)
+        with open(path, 'rb') as original, \
+                gzip.open(path + '.gz') as compressed:
+            self.assertEqual(compressed.read(), original.read())
+
+    def test_serves_gzip_with_immutable_cache(self):
+        """Файл с хешем отдаётся сжатым и кэшируется навсегда."""
+        with override_settings(STATIC_ROOT=self.root, SERVE_STATIC=True):
+            response = self.client.get(
+                settings.STATIC_URL + self.hashed,
+                HTTP_ACCEPT_ENCODING='gzip, deflate')
+            plain = self.client.get(settings.STATIC_URL + self.hashed)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Cache-Control'], staticfiles.IMMUTABLE)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)),
+                         b''.join(plain.streaming_content))
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+    def test_unhashed_names_get_short_cache(self):
+        """Файл без хеша кэшируется ненадолго и проверяется по дате."""
+        url = settings.STATIC_URL + 'css/bootstrap.min.css'
+        with override_settings(STATIC_ROOT=self.root, SERVE_STATIC=True):
+            response = self.client.get(url)
+            not_modified = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response['Cache-Control'],
+                         f'public, max-age={settings.STATIC_MAX_AGE}')
+        self.assertEqual(not_modified.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_pages_render_with_manifest(self):
+        """Страницы со статикой из base.html собираются по манифесту."""
+        storage = 'core.staticfiles.CompressedManifestStaticFilesStorage'
+        cache.clear()
+        with override_settings(STATIC_ROOT=self.root,
+                               STATICFILES_STORAGE=storage):
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, settings.STATIC_URL + self.hashed)
+        with open(os.path.join(self.root, 'staticfiles.json')) as stream:
+            favicon = json.load(stream)['paths']['img/fav/favicon.ico']
+        self.assertContains(response, settings.STATIC_URL + favicon)
+
+    def test_missing_files_fall_through(self):
+        """Чего нет в STATIC_ROOT, обрабатывают остальные middleware."""
+        with override_settings(STATIC_ROOT=self.root, SERVE_STATIC=True):
+            response = self.client.get(settings.STATIC_URL + '../x.css')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class GZipTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.html = b'<div class="card mb-3">' * 100
+
+    def get(self, response, accept='gzip, deflate'):
+        middleware = GZipMiddleware(lambda request: response)
+        return middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING=accept))
+
+    def test_pages_are_compressed(self):
+        """Страница сжимается для клиента, который принимает gzip."""
+        response = self.client.get(reverse('posts:index'),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn(b'</html>', gzip.decompress(response.content))
+
+    def test_streaming_is_compressed_by_chunks(self):
+        """Потоковый ответ сжимается по кускам, без сборки тела."""
+        consumed = []
+
+        def chunks():
+            for _ in range(3):
+                consumed.append(True)
+                yield self.html
+
+        response = self.get(StreamingHttpResponse(chunks()))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        stream = iter(response.streaming_content)
+        decompressor = zlib.decompressobj(compression.GZIP_WBITS)
+        self.assertEqual(decompressor.decompress(next(stream)), self.html)
+        self.assertEqual(len(consumed), 1)
+        rest = b''.join(decompressor.decompress(data) for data in stream)
+        self.assertEqual(rest, self.html * 2)
+
+    def test_negotiates_accept_encoding(self):
+        """gzip;q=0 и отсутствие gzip в Accept-Encoding — без сжатия."""
+        for accept in ('gzip;q=0', 'br, deflate', ''):
+            with self.subTest(accept=accept):
+                response = self.get(HttpResponse(self.html), accept)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(response.content, self.html)
+        response = self.get(HttpResponse(self.html), 'br;q=1, *;q=0.5')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_weakens_etag_and_varies(self):
+        """Сжатый ответ получает слабый ETag, Vary — и несжатый."""
+        response = HttpResponse(self.html)
+        response['ETag'] = '"abc"'
+        self.assertEqual(self.get(response)['ETag'], 'W/"abc"')
+        plain = self.get(HttpResponse(self.html), 'gzip;q=0')
+        self.assertEqual(plain['Vary'], 'Accept-Encoding')
+
+    def test_skips_tiny_binary_and_encoded_responses(self):
+        """Короткие, бинарные и уже сжатые ответы не трогаются."""
+        encoded = HttpResponse(self.html)
+        encoded['Content-Encoding'] = 'br'
+        for response in (HttpResponse(b'<p>short</p>'),
+                         HttpResponse(self.html, content_type='image/png'),
+                         encoded):
+            with self.subTest(response=response):
+                self.assertEqual(self.get(response).content,
+                                 response.content)
+        self.assertEqual(self.get(encoded)['Content-Encoding'], 'br')
+
+    @override_settings(GZIP_LEVEL=1)
+    def test_level_is_configurable(self):
+        """Уровень сжатия берётся из GZIP_LEVEL."""
+        fast = self.get(HttpResponse(self.html))
+        with override_settings(GZIP_LEVEL=9):
+            best = self.get(HttpResponse(self.html))
+        for response, level in ((fast, 1), (best, 9)):
+            deflate = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            # Без заголовка gzip (10 байт) и хвоста с CRC и длиной (8).
+            self.assertEqual(response.content[10:-8],
+                             deflate.compress(self.html) + deflate.flush())
@@ -0,0 +1,136 @@
+"""Время запроса по фазам: SQL, шаблоны, кэш, миниатюры.
+
+``instrument()`` один раз оборачивает рендер шаблонов Django, методы
+бэкендов кэша и бэкенд миниатюр sorl. Пока в потоке нет активного
+``Timings``, обёртки сразу зовут исходный метод. SQL меряется
+``execute_wrapper`` соединений, который ставится только на время
+запроса.
+
+Фазы не пересекаются: запрос к базе из шаблона идёт в ``db``, а время
+шаблона на это время останавливается. Повторный вход в ту же фазу
+(``{% include %}`` внутри шаблона) не считается отдельным вызовом.
+"""
+import threading
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template.base import Template
+from django.utils.module_loading import import_string
+
+CACHE_METHODS = ('add', 'get', 'set', 'touch', 'delete', 'get_many',
+                 'has_key', 'incr', 'decr', 'set_many', 'delete_many',
+                 'clear', 'find_keys')
+THUMBNAIL_METHODS = ('get_thumbnail', 'get_many')
+# Фаза: подпись в заголовке Server-Timing (заголовок — только латиница).
+PHASES = {
+    'db': 'SQL',
+    'template': 'Templates',
+    'cache': 'Cache',
+    'thumbnail': 'Thumbnails',
+}
+
+_local = threading.local()
+_instrumented = set()
+
+
+class Timings:
+    """Накопленное время и число вызовов фаз одного запроса."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.durations = defaultdict(float)
+        self.counts = Counter()
+        self._stack = []
+
+    @contextmanager
+    def phase(self, name):
+        if self._stack and self._stack[-1][0] == name:
+            yield
+            return
+        now = perf_counter()
+        if self._stack:
+            outer, started = self._stack[-1]
+            self.durations[outer] += now - started
+        self._stack.append([name, now])
+        self.counts[name] += 1
+        try:
+            yield
+        finally:
+            now = perf_counter()
+            started = self._stack.pop()[1]
+            self.durations[name] += now - started
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def summary(self):
+        """Строки (фаза, подпись, секунды, вызовы) с остатком app и total.
+
+        app — время вне измеряемых фаз: Python вьюх и middleware.
+        """
+        total = perf_counter() - self.started
+        rows = [(name, label, self.durations[name], self.counts[name])
+                for name, label in PHASES.items() if self.counts[name]]
+        rest = total - sum(row[2] for row in rows)
+        return rows + [('app', 'Python', max(rest, 0), None),
+                       ('total', 'Total', total, None)]
+
+
+def current():
+    """Timings текущего запроса этого потока или None."""
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def measure():
+    """Меряет фазы кода внутри блока, включая SQL всех соединений."""
+    timings = Timings()
+    _local.timings = timings
+
+    def execute(execute, sql, params, many, context):
+        with timings.phase('db'):
+            return execute(sql, params, many, context)
+
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(execute))
+            yield timings
+    finally:
+        _local.timings = None
+
+
+def timed(method, name):
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        timings = current()
+        if timings is None:
+            return method(*args, **kwargs)
+        with timings.phase(name):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def patch(cls, names, phase):
+    """Оборачивает методы класса, если ещё не обёрнуты."""
+    if cls in _instrumented:
+        return
+    _instrumented.add(cls)
+    for name in names:
+        method = getattr(cls, name, None)
+        if method is not None:
+            setattr(cls, name, timed(method, phase))
+
+
+def instrument():
+    """Оборачивает шаблоны, кэши и миниатюры, один раз на процесс."""
+    patch(Template, ['render'], 'template')
+    for alias in settings.CACHES:
+        patch(type(caches[alias]), CACHE_METHODS, 'cache')
+    backend = getattr(settings, 'THUMBNAIL_BACKEND', None)
+    if backend:
+        patch(import_string(backend), THUMBNAIL_METHODS, 'thumbnail')
@@ -0,0 +1,75 @@
+"""Прогрев воркера до того, как он начнёт принимать запросы.
+
+Компилирует все шаблоны (с кэширующим загрузчиком они остаются
+в памяти процесса), собирает таблицы URL и настраивает движок,
+хранилище и KVStore sorl-thumbnail с плагинами Pillow. Вызывается
+из ``wsgi.py`` и командой ``manage.py warmup``.
+"""
+import logging
+import os
+from time import perf_counter
+
+from django.template import TemplateSyntaxError, engines
+from django.urls import get_resolver
+from PIL import Image
+from sorl.thumbnail import default
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_SUFFIXES = ('.html', '.txt')
+SORL_PARTS = ('engine', 'storage', 'kvstore', 'backend')
+
+
+def template_names(engine):
+    """Имена всех шаблонов в каталогах загрузчиков движка."""
+    names = set()
+    for loader in engine.engine.template_loaders:
+        for inner in getattr(loader, 'loaders', [loader]):
+            for directory in inner.get_dirs():
+                for root, dirs, files in os.walk(directory):
+                    names.update(
+                        os.path.relpath(os.path.join(root, name), directory)
+                        .replace(os.sep, '/')
+                        for name in files if name.endswith(TEMPLATE_SUFFIXES))
+    return sorted(names)
+
+
+def compile_templates():
+    """Компилирует шаблоны всех движков Django; (готово, [ошибки])."""
+    compiled, errors = 0, []
+    for engine in engines.all():
+        if not hasattr(engine, 'engine'):
+            continue
+        for name in template_names(engine):
+            try:
+                engine.get_template(name)
+            except TemplateSyntaxError as exc:
+                errors.append(f'{name}: {exc}')
+                logger.warning('Шаблон %s не компилируется: %s', name, exc)
+            else:
+                compiled += 1
+    return compiled, errors
+
+
+def populate_urls(resolver):
+    """Собирает таблицы reverse резолвера и всех его пространств имён."""
+    count = len(resolver.reverse_dict)
+    for prefix, namespace in resolver.namespace_dict.values():
+        count += populate_urls(namespace)
+    return count
+
+
+def warmup():
+    """Прогревает процесс; возвращает статистику для вывода."""
+    started = perf_counter()
+    templates, errors = compile_templates()
+    urls = populate_urls(get_resolver())
+    Image.init()
+    sorl = [getattr(default, part).__class__.__name__ for part in SORL_PARTS]
+    return {
+        'templates': templates,
+        'errors': errors,
+        'urls': urls,
+        'sorl': sorl,
+        'seconds': perf_counter() - started,
+    }
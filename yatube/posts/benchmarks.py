@@ -0,0 +1,220 @@
+"""Замеры представлений на синтетических данных разного размера.
+
+Сценарий — запрос к представлению через тестовый клиент. Для каждого
+сценария записываются перцентили времени ответа, число SQL-запросов
+и пик выделенной памяти (tracemalloc). Страницы меряются дважды:
+с пустым кэшем (``cold``) и с прогретым (``warm``); формы, которые
+пишут в базу, — один раз (``write``).
+
+``compare`` сверяет отчёт с сохранённым базовым и возвращает список
+замедлений.
+"""
+import math
+import time
+import tracemalloc
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Comment, Follow, Group, Post, User
+
+PERCENTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+# Разница меньше этой считается шумом, сколько бы процентов она ни была.
+NOISE_MS = 1.0
+# Насколько может вырасти наклон log(время) / log(число постов).
+SCALING_TOLERANCE = 0.2
+
+Scenario = namedtuple('Scenario', 'method url data login')
+Subjects = namedtuple('Subjects', 'group author post reader')
+
+SCENARIOS = {
+    'index': Scenario(
+        'get', lambda s: reverse('posts:index'), None, False),
+    'group_posts': Scenario(
+        'get', lambda s: reverse('posts:group_list', args=[s.group.slug]),
+        None, False),
+    'profile': Scenario(
+        'get', lambda s: reverse('posts:profile', args=[s.author.username]),
+        None, False),
+    'post_detail': Scenario(
+        'get', lambda s: reverse('posts:post_detail', args=[s.post.pk]),
+        None, False),
+    'follow_index': Scenario(
+        'get', lambda s: reverse('posts:follow_index'), None, True),
+    'add_comment': Scenario(
+        'post', lambda s: reverse('posts:add_comment', args=[s.post.pk]),
+        lambda s: {'text': 'Комментарий замера'}, True),
+    'post_create': Scenario(
+        'post', lambda s: reverse('posts:post_create'),
+        lambda s: {'text': 'Пост замера', 'group': s.group.pk}, True),
+}
+
+
+def most(queryset, field):
+    """Объект с наибольшим числом связанных строк field."""
+    return (queryset
+            .annotate(related=Count(field))
+            .order_by('-related', 'pk')
+            .first())
+
+
+def pick_subjects():
+    """Самые нагруженные группа, автор, пост и читатель ленты подписок."""
+    post_id = (Comment.objects
+               .order_by()
+               .values_list('post_id')
+               .annotate(related=Count('pk'))
+               .order_by('-related', 'post_id')
+               .values_list('post_id', flat=True)
+               .first())
+    post = Post.objects.filter(pk=post_id).first() or Post.objects.first()
+    reader_id = (Follow.objects
+                 .order_by()
+                 .values_list('user_id')
+                 .annotate(related=Count('pk'))
+                 .order_by('-related', 'user_id')
+                 .values_list('user_id', flat=True)
+                 .first())
+    reader = User.objects.filter(pk=reader_id).first() or post.author
+    return Subjects(
+        group=most(Group.objects.all(), 'post'),
+        author=most(User.objects.all(), 'posts'),
+        post=post,
+        reader=reader,
+    )
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+def request(client, scenario, url, data):
+    response = getattr(client, scenario.method)(url, data)
+    if response.status_code >= 400:
+        raise RuntimeError(f'{url} ответил {response.status_code}')
+    return response
+
+
+def measure(client, scenario, subjects, repeat, warmup, cold):
+    """Статистика одного сценария в одном режиме кэша."""
+    url = scenario.url(subjects)
+    data = scenario.data(subjects) if scenario.data else None
+    for _ in range(warmup):
+        request(client, scenario, url, data)
+    timings, queries = [], []
+    for _ in range(repeat):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            request(client, scenario, url, data)
+            timings.append(time.perf_counter() - start)
+        queries.append(len(captured))
+    # Память — отдельным запросом: tracemalloc замедляет код в разы.
+    if cold:
+        cache.clear()
+    tracemalloc.start()
+    try:
+        request(client, scenario, url, data)
+        memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    stats = {name: round(percentile(timings, share) * 1000, 3)
+             for name, share in PERCENTILES.items()}
+    stats['max'] = round(max(timings) * 1000, 3)
+    stats['queries'] = max(queries)
+    stats['memory'] = memory
+    return stats
+
+
+def run(names, repeat, warmup):
+    """Замеры выбранных сценариев на текущих данных: {сценарий: {режим}}."""
+    subjects = pick_subjects()
+    anonymous = Client()
+    reader = Client()
+    reader.force_login(subjects.reader)
+    results = {}
+    for name in names:
+        scenario = SCENARIOS[name]
+        client = reader if scenario.login else anonymous
+        if scenario.method == 'get':
+            modes = {'cold': True, 'warm': False}
+        else:
+            modes = {'write': False}
+        results[name] = {
+            mode: measure(client, scenario, subjects, repeat, warmup, cold)
+            for mode, cold in modes.items()
+        }
+    return results
+
+
+def scaling(results):
+    """Наклон log(p50) / log(число постов) между крайними размерами.
+
+    Около нуля — время не зависит от объёма данных, около единицы —
+    растёт линейно.
+    """
+    sizes = sorted(results, key=int)
+    if len(sizes) < 2:
+        return {}
+    first, last = sizes[0], sizes[-1]
+    growth = math.log(int(last) / int(first))
+    slopes = {}
+    for name, modes in results[last].items():
+        for mode, stats in modes.items():
+            before = results[first].get(name, {}).get(mode)
+            if before and before['p50'] > 0 and stats['p50'] > 0:
+                slopes.setdefault(name, {})[mode] = round(
+                    math.log(stats['p50'] / before['p50']) / growth, 3)
+    return slopes
+
+
+def compare_stats(label, stats, base, tolerance):
+    regressions = []
+    for key in PERCENTILES:
+        if (stats[key] > base[key] * (1 + tolerance)
+                and stats[key] - base[key] > NOISE_MS):
+            regressions.append(
+                f'{label}: {key} {base[key]} → {stats[key]} мс')
+    if stats['queries'] > base['queries']:
+        regressions.append(
+            f'{label}: запросов {base["queries"]} → {stats["queries"]}')
+    if stats['memory'] > base['memory'] * (1 + tolerance):
+        regressions.append(
+            f'{label}: память {base["memory"]} → {stats["memory"]} байт')
+    return regressions
+
+
+def compare(report, baseline, tolerance):
+    """Замедления отчёта относительно базового, списком строк.
+
+    Время и память сравниваются с допуском tolerance, число запросов —
+    строго. Рост с объёмом данных сверяется, только если размеры в
+    отчётах совпадают.
+    """
+    regressions = []
+    for size, scenarios in report['results'].items():
+        for name, modes in scenarios.items():
+            for mode, stats in modes.items():
+                base = baseline['results'].get(size, {}).get(
+                    name, {}).get(mode)
+                if base is not None:
+                    regressions += compare_stats(
+                        f'{name} [{mode}] на {size} постах',
+                        stats, base, tolerance)
+    if report['sizes'] != baseline.get('sizes'):
+        return regressions
+    for name, modes in report['scaling'].items():
+        for mode, slope in modes.items():
+            base = baseline['scaling'].get(name, {}).get(mode)
+            if base is not None and slope > base + SCALING_TOLERANCE:
+                regressions.append(
+                    f'{name} [{mode}]: рост с объёмом {base} → {slope}')
+    return regressions
@@ -0,0 +1,119 @@
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import (Comment, Follow, Group, GroupCounters, Post,
+                     SiteCounters, User, UserCounters)
+
+BATCH_SIZE = 1000
+
+
+def count_of(model, field):
+    """Подзапрос: число строк model, которые ссылаются на внешний объект."""
+    rows = (model.objects
+            .filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'))
+    return Coalesce(Subquery(rows), Value(0))
+
+
+class CounterSet:
+    """Денормализованные счётчики владельца (пользователя или группы).
+
+    ``spec`` сопоставляет имя счётчика с моделью-источником и полем,
+    которым её строки ссылаются на владельца.
+    """
+
+    def __init__(self, model, owner_model, spec):
+        self.model = model
+        self.owner_model = owner_model
+        self.spec = spec
+
+    def get(self, pk):
+        """Счётчики владельца; отсутствующие считаются по источникам."""
+        counters = self.model.objects.filter(pk=pk).first()
+        if counters is None:
+            counters = next(
+                self._build(self.owner_model.objects.filter(pk=pk)), None)
+            if counters is not None:
+                self.model.objects.bulk_create(
+                    [counters], ignore_conflicts=True)
+        return counters
+
+    def change(self, pk, **deltas):
+        """Атомарно сдвигает счётчики владельца на deltas."""
+        updated = self.model.objects.filter(pk=pk).update(**{
+            name: Greatest(F(name) + delta, Value(0))
+            for name, delta in deltas.items()
+        })
+        if not updated and any(delta > 0 for delta in deltas.values()):
+            # Строки ещё нет: считаем её целиком, вместе с только что
+            # записанным объектом. При удалении строку не создаём —
+            # владелец может удаляться каскадом.
+            self.get(pk)
+
+    def rebuild(self):
+        """Пересчитывает все счётчики с нуля."""
+        counters = self._build(self.owner_model.objects.order_by('pk'))
+        with transaction.atomic():
+            self.model.objects.all().delete()
+            while True:
+                batch = list(islice(counters, BATCH_SIZE))
+                if not batch:
+                    break
+                self.model.objects.bulk_create(batch)
+
+    def _build(self, owners):
+        pk_name = self.model._meta.pk.attname
+        totals = {f'{name}_total': count_of(model, field)
+                  for name, (model, field) in self.spec.items()}
+        for row in owners.annotate(**totals).values('pk', *totals).iterator():
+            yield self.model(**{pk_name: row['pk']}, **{
+                name: row[f'{name}_total'] for name in self.spec})
+
+
+class SiteCounterSet(CounterSet):
+    """Счётчики всего сайта: одна строка с ключом SITE_PK."""
+
+    SITE_PK = 1
+
+    def __init__(self, model, spec):
+        super().__init__(model, None, spec)
+
+    def get(self, pk=SITE_PK):
+        counters = self.model.objects.filter(pk=pk).first()
+        if counters is None:
+            counters = next(self._build(None))
+            self.model.objects.bulk_create([counters], ignore_conflicts=True)
+        return counters
+
+    def change(self, pk=SITE_PK, **deltas):
+        super().change(pk, **deltas)
+
+    def rebuild(self):
+        with transaction.atomic():
+            self.model.objects.all().delete()
+            self.model.objects.bulk_create(self._build(None))
+
+    def _build(self, owners):
+        yield self.model(pk=self.SITE_PK, **{
+            name: model.objects.count()
+            for name, (model, field) in self.spec.items()})
+
+
+users = CounterSet(UserCounters, User, {
+    'posts': (Post, 'author'),
+    'comments': (Comment, 'author'),
+    'followers': (Follow, 'author'),
+    'following': (Follow, 'user'),
+})
+groups = CounterSet(GroupCounters, Group, {
+    'posts': (Post, 'group'),
+})
+site = SiteCounterSet(SiteCounters, {
+    'posts': (Post, None),
+})
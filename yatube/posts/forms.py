@@ -1,6 +1,9 @@
+from django import forms
+from django.core.files.uploadedfile import SimpleUploadedFile, UploadedFile
 from django.forms import ModelForm, Textarea
 
-from .models import Post, Comment
+from . import images
+from .models import Post, Comment, Group
 
 
 class PostForm(ModelForm):
@@ -22,6 +25,28 @@ class PostForm(ModelForm):
                                     'placeholder': 'Текст тут'}),
         }
 
+    def clean_image(self):
+        """Новая картинка уходит на обработку в пул (posts.images)."""
+        image = self.cleaned_data.get('image')
+        self.image_size = None
+        if not isinstance(image, UploadedFile):
+            return image
+        image.seek(0)
+        try:
+            data, self.image_size = images.normalize_upload(image.read())
+        except images.Busy:
+            raise forms.ValidationError(
+                'Сервер занят обработкой картинок, попробуйте ещё раз.')
+        except images.ImageError:
+            raise forms.ValidationError('Не удалось обработать картинку.')
+        return SimpleUploadedFile(image.name, data, image.content_type)
+
+    def save(self, commit=True):
+        if 'image' in self.changed_data:
+            self.instance.image_width, self.instance.image_height = (
+                self.image_size or (None, None))
+        return super().save(commit)
+
 
 class CommentForm(ModelForm):
     class Meta:
@@ -31,3 +56,11 @@ class CommentForm(ModelForm):
             'text': Textarea(attrs={'class': 'form-control',
                                     'placeholder': 'Комментарий тут'})
         }
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label='Запрос', max_length=200)
+    group = forms.ModelChoiceField(
+        Group.objects.all(), label='Группа', required=False,
+        to_field_name='slug', empty_label='Все группы')
+    author = forms.CharField(label='Автор', max_length=150, required=False)
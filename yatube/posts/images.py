@@ -0,0 +1,140 @@
+"""Обработка загруженных картинок постов в пуле процессов.
+
+Картинка поворачивается по EXIF, уменьшается до ``IMAGE_MAX_SIDE``
+по большей стороне и пересохраняется в том же формате без метаданных
+(цветовой профиль остаётся). У анимаций так же уменьшается каждый
+кадр, длительности кадров и повторы сохраняются.
+
+Обработка синхронная: поток запроса ждёт результата, зато в базу
+попадает уже готовая картинка, а имя файла (хеш содержимого, см.
+posts.storage) потом не меняется. Пул процессов нужен не для того,
+чтобы освободить воркер, а чтобы ограничить память и CPU под Pillow
+и не ронять воркер на битом файле. Одновременно в пуле не больше
+``IMAGE_QUEUE_SIZE`` картинок; если место не освободилось за
+``IMAGE_QUEUE_TIMEOUT`` секунд, загрузка отклоняется с ``Busy``, а
+не копится в очереди.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageOps, ImageSequence
+
+SAVE_OPTIONS = {
+    'JPEG': {'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'method': 4},
+}
+# JPEG не умеет прозрачность и палитру.
+JPEG_MODES = ('RGB', 'L', 'CMYK')
+# Длительность кадра анимации в мс, если файл её не указывает.
+DEFAULT_DURATION = 100
+# Что из info картинки попадает в файл: профиль и прозрачность палитры.
+KEPT_INFO = ('icc_profile', 'transparency')
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+class Busy(Exception):
+    """Пул занят дольше, чем готова ждать загрузка."""
+
+
+class ImageError(Exception):
+    """Картинку не удалось обработать."""
+
+
+def normalize(data, max_side, quality):
+    """Байты обработанной картинки и её (ширина, высота).
+
+    Выполняется в процессе пула, поэтому без Django и моделей.
+    """
+    with Image.open(BytesIO(data)) as source:
+        if getattr(source, 'is_animated', False):
+            return normalize_animation(source, max_side)
+        image_format = source.format
+        icc_profile = source.info.get('icc_profile')
+        image = ImageOps.exif_transpose(source)
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    options = dict(SAVE_OPTIONS.get(image_format, {}))
+    if image_format in ('JPEG', 'WEBP'):
+        options['quality'] = quality
+    if image_format == 'JPEG' and image.mode not in JPEG_MODES:
+        image = image.convert('RGB')
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    # save() берёт из info комментарии (GIF), XMP и прочее — сбрасываем.
+    image.info = {key: value for key, value in image.info.items()
+                  if key in KEPT_INFO}
+    output = BytesIO()
+    image.save(output, image_format, **options)
+    return output.getvalue(), image.size
+
+
+def normalize_animation(source, max_side):
+    """Анимация с уменьшенными кадрами и без метаданных."""
+    frames, durations = [], []
+    for frame in ImageSequence.Iterator(source):
+        frame.load()
+        durations.append(frame.info.get('duration', DEFAULT_DURATION))
+        frame = frame.convert('RGBA')
+        frame.thumbnail((max_side, max_side), Image.LANCZOS)
+        # convert() копирует info кадра, а с ним EXIF, XMP и комментарии.
+        frame.info = {}
+        frames.append(frame)
+    output = BytesIO()
+    frames[0].save(output, source.format, save_all=True,
+                   append_images=frames[1:], duration=durations,
+                   loop=source.info.get('loop', 0))
+    return output.getvalue(), frames[0].size
+
+
+def get_executor():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            _slots = threading.BoundedSemaphore(settings.IMAGE_QUEUE_SIZE)
+        return _executor, _slots
+
+
+def reset_executor():
+    """Убирает сломанный пул: следующий вызов создаст новый."""
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+
+def normalize_upload(data):
+    """Обрабатывает байты загрузки в пуле; (байты, (ширина, высота))."""
+    executor, slots = get_executor()
+    if not slots.acquire(timeout=settings.IMAGE_QUEUE_TIMEOUT):
+        raise Busy
+    try:
+        future = executor.submit(normalize, data, settings.IMAGE_MAX_SIDE,
+                                 settings.IMAGE_QUALITY)
+    except BaseException:
+        slots.release()
+        raise
+    # Место освобождается, когда процесс закончит, даже если запрос
+    # перестал ждать: иначе очередь не была бы ограничена.
+    future.add_done_callback(lambda future: slots.release())
+    try:
+        return future.result(timeout=settings.IMAGE_PROCESS_TIMEOUT)
+    except FutureTimeoutError:
+        raise Busy
+    except BrokenProcessPool:
+        reset_executor()
+        raise Busy
+    except Exception as exc:
+        raise ImageError(str(exc)) from exc
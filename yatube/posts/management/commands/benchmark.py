@@ -0,0 +1,167 @@
+import json
+import os
+import platform
+import tempfile
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.cache import relocated
+from posts import benchmarks
+from posts.models import Group, Post
+
+DEFAULT_SIZES = '1000,10000'
+
+
+def parse_sizes(value):
+    try:
+        sizes = sorted({int(size) for size in value.split(',')})
+    except ValueError:
+        raise CommandError(f'Не понимаю --sizes: {value}')
+    if sizes[0] < 1:
+        raise CommandError('Размеры должны быть положительными.')
+    return sizes
+
+
+class Command(BaseCommand):
+    help = ('Меряет время ответа, число SQL-запросов и память представлений '
+            'на данных нескольких размеров и сверяет с базовым отчётом.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default=DEFAULT_SIZES,
+            help='Число постов через запятую, данные дозаполняются '
+                 'от меньшего размера к большему.')
+        parser.add_argument(
+            '--scenarios', default=','.join(benchmarks.SCENARIOS),
+            help='Сценарии через запятую: '
+                 + ', '.join(benchmarks.SCENARIOS) + '.')
+        parser.add_argument('--repeat', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output',
+            help='Файл для JSON-отчёта; без него — в stdout.')
+        parser.add_argument(
+            '--baseline', default=settings.BENCHMARK_BASELINE,
+            help='Базовый отчёт для сравнения.')
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать отчёт как новый базовый.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Допустимый рост времени и памяти, доля от базового.')
+        parser.add_argument(
+            '--in-place', action='store_true',
+            help='Мерить на текущей базе, а не на отдельной.')
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять отдельную базу: следующий запуск не будет '
+                 'заполнять её заново.')
+
+    def handle(self, *args, **options):
+        sizes = parse_sizes(options['sizes'])
+        names = options['scenarios'].split(',')
+        unknown = set(names) - set(benchmarks.SCENARIOS)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть не меньше 1.')
+        # Кэш сайта не трогаем: замеры чистят кэш и пишут в него
+        # страницы со своими данными.
+        with tempfile.TemporaryDirectory(prefix='yatube-benchmark-') as tmp:
+            with override_settings(CACHES=relocated(settings.CACHES, tmp)):
+                report = self.isolated(sizes, names, options)
+        self.write_report(report, options['output'])
+        self.check_baseline(report, options)
+
+    def isolated(self, sizes, names, options):
+        """Замеры на отдельной базе, если не указан --in-place."""
+        if options['in_place']:
+            return self.benchmark(sizes, names, options)
+        old_name = connection.settings_dict['NAME']
+        connection.settings_dict['TEST']['NAME'] = (
+            settings.BENCHMARK_DATABASE)
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            return self.benchmark(sizes, names, options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+
+    def benchmark(self, sizes, names, options):
+        results = {}
+        for size in sizes:
+            if not self.grow(size, options['seed'] + size):
+                continue
+            cache.clear()
+            self.stderr.write(f'Замеры на {size} постах…')
+            results[str(size)] = benchmarks.run(
+                names, options['repeat'], options['warmup'])
+        return {
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'sizes': [int(size) for size in results],
+            'results': results,
+            'scaling': benchmarks.scaling(results),
+        }
+
+    def grow(self, size, seed):
+        """Дозаполняет базу до size постов; False, если постов уже больше."""
+        missing = size - Post.objects.count()
+        if missing < 0:
+            self.stderr.write(
+                f'В базе больше {size} постов, размер пропущен.')
+            return False
+        if missing:
+            call_command(
+                'seed',
+                users=max(1, missing // 10),
+                groups=missing // 500 + (not Group.objects.exists()),
+                posts=missing,
+                comments=missing * 2,
+                seed=seed,
+                stdout=self.stderr,
+            )
+        return True
+
+    def write_report(self, report, output):
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if output is None:
+            self.stdout.write(text)
+            return
+        with open(output, 'w', encoding='utf-8') as stream:
+            stream.write(text + '\n')
+        self.stderr.write(f'Отчёт записан в {output}')
+
+    def check_baseline(self, report, options):
+        path = options['baseline']
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.write_report(report, path)
+            return
+        if not os.path.exists(path):
+            self.stderr.write(f'Базового отчёта {path} нет, сравнивать '
+                              f'не с чем.')
+            return
+        with open(path, encoding='utf-8') as stream:
+            baseline = json.load(stream)
+        regressions = benchmarks.compare(
+            report, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError(
+                'Замедления относительно базового отчёта:\n'
+                + '\n'.join(regressions))
+        self.stderr.write(self.style.SUCCESS(
+            'Замедлений относительно базового отчёта нет.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики пользователей, групп и сайта с нуля.'
+
+    def handle(self, *args, **options):
+        counters.users.rebuild()
+        counters.groups.rebuild()
+        counters.site.rebuild()
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны.'))
@@ -0,0 +1,237 @@
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from posts import counters, search, timeline
+from posts.models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 5000
+WORDS = ('пост', 'лента', 'группа', 'автор', 'подписка', 'комментарий',
+         'картинка', 'новость', 'день', 'город', 'кот', 'кофе', 'код',
+         'утро', 'вечер', 'дождь', 'солнце', 'книга', 'музыка', 'фильм')
+IMAGE_VARIANTS = 16
+# Даты постов и комментариев разбросаны по SPREAD до EPOCH плюс seed
+# дней: от часов запуска они не зависят.
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+SPREAD = timedelta(days=365)
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+@contextmanager
+def explicit_dates():
+    """Даёт bulk_create записать свои даты вместо auto_now_add."""
+    fields = [Post._meta.get_field('pub_date'),
+              Comment._meta.get_field('created')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, комментариями и подписками для нагрузочных тестов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок пользователя; популярность '
+                 'авторов распределена по степенному закону.')
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Показатель степенного закона популярности авторов.')
+        parser.add_argument(
+            '--images', type=float, default=0.0,
+            help='Доля постов с картинкой, от 0 до 1.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--faker', action='store_true',
+            help='Правдоподобные имена и тексты из Faker (медленнее).')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--no-derived', action='store_true',
+            help='Не строить ленты, счётчики и индекс поиска.')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['images'] <= 1:
+            raise CommandError('--images должна быть от 0 до 1.')
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.faker = None
+        if options['faker']:
+            from faker import Faker
+            self.faker = Faker('ru_RU')
+            self.faker.seed_instance(options['seed'])
+        self.now = EPOCH + timedelta(days=options['seed'])
+
+        users = self.seed_users(options['users'])
+        groups = self.seed_groups(options['groups'])
+        images = self.seed_images() if options['images'] else []
+        posts = self.seed_posts(options['posts'], users, groups,
+                                images, options['images'])
+        if posts:
+            self.seed_comments(options['comments'], users, posts)
+        self.seed_follows(options['follows'], options['zipf'], users)
+        if not options['no_derived']:
+            self.build_derived()
+        # bulk_create не сбрасывает поколения кэша страниц и карточек.
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS('База заполнена.'))
+
+    def create(self, model, objects):
+        """bulk_create пачками внутри одной транзакции."""
+        batch, total = [], 0
+        with transaction.atomic():
+            for obj in objects:
+                batch.append(obj)
+                if len(batch) == self.batch_size:
+                    model.objects.bulk_create(batch)
+                    total += len(batch)
+                    batch = []
+            model.objects.bulk_create(batch)
+            total += len(batch)
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {total}')
+
+    def text(self):
+        if self.faker is not None:
+            return self.faker.paragraph(nb_sentences=3)
+        return ' '.join(self.random.choices(
+            WORDS, k=self.random.randint(5, 40))).capitalize()
+
+    def date(self):
+        return self.now - SPREAD * self.random.random()
+
+    def seed_users(self, total):
+        start = next_id(User)
+        ids = range(start, start + total)
+
+        def users():
+            for pk in ids:
+                if self.faker is not None:
+                    first_name = self.faker.first_name()
+                    last_name = self.faker.last_name()
+                else:
+                    first_name, last_name = 'Пользователь', str(pk)
+                yield User(id=pk, username=f'seed{pk}', password='!',
+                           first_name=first_name, last_name=last_name)
+
+        self.create(User, users())
+        return ids
+
+    def seed_groups(self, total):
+        start = next_id(Group)
+        ids = range(start, start + total)
+
+        def groups():
+            for pk in ids:
+                title = (self.faker.catch_phrase()[:200]
+                         if self.faker is not None else f'Группа {pk}')
+                yield Group(id=pk, title=title, slug=f'seed-{pk}',
+                            description=self.text())
+
+        self.create(Group, groups())
+        return ids
+
+    def seed_images(self):
+        """Несколько маленьких картинок, общих для всех постов."""
+        storage = Post._meta.get_field('image').storage
+        names = []
+        for number in range(IMAGE_VARIANTS):
+            color = tuple(self.random.randrange(256) for _ in range(3))
+            buffer = BytesIO()
+            Image.new('RGB', (960, 540), color).save(buffer, 'JPEG')
+            names.append(storage.save(
+                f'posts/seed-{number}.jpg', ContentFile(buffer.getvalue())))
+        return names
+
+    def seed_posts(self, total, users, groups, images, image_share):
+        start = next_id(Post)
+        ids = range(start, start + total)
+
+        def posts():
+            for pk in ids:
+                group_id = None
+                if groups and self.random.random() < 0.5:
+                    group_id = self.random.choice(groups)
+                image = ''
+                if images and self.random.random() < image_share:
+                    image = self.random.choice(images)
+                yield Post(id=pk, text=self.text(), pub_date=self.date(),
+                           author_id=self.random.choice(users),
+                           group_id=group_id, image=image)
+
+        with explicit_dates():
+            self.create(Post, posts())
+        return ids
+
+    def seed_comments(self, total, users, posts):
+        start = next_id(Comment)
+
+        def comments():
+            for pk in range(start, start + total):
+                yield Comment(id=pk, text=self.text(), created=self.date(),
+                              post_id=self.random.choice(posts),
+                              author_id=self.random.choice(users))
+
+        with explicit_dates():
+            self.create(Comment, comments())
+
+    def seed_follows(self, average, exponent, users):
+        """Подписки: популярность автора ранга r пропорциональна r^-zipf."""
+        if len(users) < 2 or average <= 0:
+            return
+        authors = list(users)
+        self.random.shuffle(authors)
+        weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(authors) + 1)))
+        start = next_id(Follow)
+        limit = len(authors) - 1
+
+        def follows():
+            pk = start
+            for user_id in users:
+                wanted = min(limit, int(self.random.expovariate(1 / average)))
+                chosen = set()
+                while len(chosen) < wanted:
+                    author_id = self.random.choices(
+                        authors, cum_weights=weights)[0]
+                    if author_id != user_id:
+                        chosen.add(author_id)
+                for author_id in chosen:
+                    yield Follow(id=pk, user_id=user_id, author_id=author_id)
+                    pk += 1
+
+        self.create(Follow, follows())
+
+    def build_derived(self):
+        """Данные, которые обычно ведут сигналы: bulk_create их минует."""
+        counters.users.rebuild()
+        counters.groups.rebuild()
+        counters.site.rebuild()
+        self.stdout.write('Счётчики пересчитаны.')
+        timeline.rebuild()
+        self.stdout.write('Ленты подписок разложены.')
+        search.rebuild()
+        self.stdout.write('Индекс поиска построен.')
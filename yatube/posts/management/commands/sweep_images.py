@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки постов и их миниатюры, на которые не '
+            'ссылается ни один пост. Запускается по расписанию.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=settings.IMAGE_SWEEP_GRACE,
+            help='Не трогать файлы, изменённые меньше стольких секунд '
+                 'назад.')
+
+    def handle(self, *args, **options):
+        removed = thumbnails.sweep(options['grace'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено картинок: {removed}.'))
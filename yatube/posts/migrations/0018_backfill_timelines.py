@@ -0,0 +1,49 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def backfill_timelines(apps, schema_editor):
+    """Ленты подписок для подписок, созданных до появления TimelineEntry.
+
+    Повторяет posts.timeline.rebuild на исторических моделях.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    authors = list(Follow.objects
+                   .order_by()
+                   .values('author_id')
+                   .annotate(followers=Count('pk'))
+                   .filter(followers__lt=settings.TIMELINE_FANOUT_LIMIT)
+                   .values_list('author_id', flat=True))
+    entries = (
+        TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+        for author_id in authors
+        for user_id in (Follow.objects
+                        .filter(author_id=author_id)
+                        .values_list('user_id', flat=True))
+        for pk, pub_date in (Post.objects
+                             .filter(author_id=author_id)
+                             .values_list('pk', 'pub_date'))
+    )
+    while True:
+        batch = list(islice(entries, BATCH_SIZE))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_auto_20261018_0455'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_backfill_timelines'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteCounters',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posts', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+            ],
+            options={
+                'verbose_name': 'Счётчики сайта',
+                'verbose_name_plural': 'Счётчики сайта',
+            },
+        ),
+    ]
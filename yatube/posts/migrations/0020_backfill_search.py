@@ -0,0 +1,42 @@
+from collections import Counter
+from itertools import islice
+
+from django.db import migrations
+
+from posts.search import tokenize
+
+BATCH_SIZE = 1000
+
+
+def backfill_search(apps, schema_editor):
+    """Индекс поиска для постов, созданных до появления SearchTerm.
+
+    Повторяет posts.search.rebuild на исторических моделях; слова
+    разбирает тот же tokenize, что и запросы.
+    """
+    Post = apps.get_model('posts', 'Post')
+    SearchTerm = apps.get_model('posts', 'SearchTerm')
+    terms = (
+        SearchTerm(term=term, post_id=pk, frequency=frequency)
+        for pk, text in (Post.objects
+                         .order_by('pk')
+                         .values_list('pk', 'text')
+                         .iterator())
+        for term, frequency in Counter(tokenize(text)).items()
+    )
+    while True:
+        batch = list(islice(terms, BATCH_SIZE))
+        if not batch:
+            return
+        SearchTerm.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_sitecounters'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations
+
+from posts.counters import count_of
+
+BATCH_SIZE = 1000
+
+
+def backfill_user_counters(apps, schema_editor):
+    """Счётчики пользователей, у которых строки UserCounters ещё нет.
+
+    Популярных авторов лента подписок находит по
+    UserCounters.followers, а строки создаются лениво: без них посты
+    автора не попали бы ни в одну ленту. Повторяет counters.users на
+    исторических моделях.
+    """
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    rows = (User.objects
+            .filter(counters__isnull=True)
+            .order_by('pk')
+            .annotate(posts_total=count_of(Post, 'author'),
+                      comments_total=count_of(Comment, 'author'),
+                      followers_total=count_of(Follow, 'author'),
+                      following_total=count_of(Follow, 'user'))
+            .values_list('pk', 'posts_total', 'comments_total',
+                         'followers_total', 'following_total')
+            .iterator())
+    counters = (
+        UserCounters(user_id=pk, posts=posts, comments=comments,
+                     followers=followers, following=following)
+        for pk, posts, comments, followers, following in rows
+    )
+    while True:
+        batch = list(islice(counters, BATCH_SIZE))
+        if not batch:
+            return
+        UserCounters.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0020_backfill_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_user_counters,
+                             migrations.RunPython.noop),
+    ]
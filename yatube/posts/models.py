@@ -1,10 +1,26 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.conf import settings
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
+class AtomicSaveMixin:
+    """Сохранение и обработчики post_save в одной транзакции.
+
+    Обработчики ведут счётчики (posts.counters): без общей транзакции
+    запись вне запроса — из shell, команды или фоновой задачи — может
+    сохраниться без сдвига счётчика. Удаление Django уже выполняет
+    вместе с post_delete в транзакции.
+    """
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
 class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
@@ -18,7 +34,17 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для карточек ленты: автор и группа одним запросом."""
+        return (self
+                .select_related('author', 'group')
+                .only('text', 'pub_date', 'image',
+                      'author__username', 'author__first_name',
+                      'author__last_name', 'group__slug'))
+
+
+class Post(AtomicSaveMixin, models.Model):
     text = models.TextField(
         'Текст поста',
         help_text='Введите текст поста'
@@ -44,8 +70,16 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    # Размеры после обработки при загрузке (posts.images).
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:settings.LEN_TEXT]
@@ -54,9 +88,17 @@ class Post(models.Model):
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=('-pub_date', '-id'),
+                         name='post_pub_date_idx'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=('group', '-pub_date', '-id'),
+                         name='post_group_pub_date_idx'),
+        ]
 
 
-class Comment(models.Model):
+class Comment(AtomicSaveMixin, models.Model):
 
     post = models.ForeignKey(
         Post,
@@ -85,9 +127,13 @@ class Comment(models.Model):
         ordering = ('-created',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(fields=('post', '-created', '-id'),
+                         name='comment_post_created_idx'),
+        ]
 
 
-class Follow(models.Model):
+class Follow(AtomicSaveMixin, models.Model):
     user = models.ForeignKey(
         User,
         related_name='follower',
@@ -100,3 +146,104 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Автор'
     )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('user', 'author'),
+                         name='follow_user_author_idx'),
+            models.Index(fields=('author', 'user'),
+                         name='follow_author_user_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        related_name='timeline',
+        on_delete=models.CASCADE,
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name='timeline_entries',
+        on_delete=models.CASCADE,
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'), name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=('user', '-pub_date', '-post'),
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+
+class SearchTerm(models.Model):
+    """Слово поста в инвертированном индексе поиска."""
+    term = models.CharField('Слово', max_length=64)
+    post = models.ForeignKey(
+        Post,
+        related_name='search_terms',
+        on_delete=models.CASCADE,
+        verbose_name='Пост'
+    )
+    frequency = models.PositiveIntegerField('Вхождений')
+
+    class Meta:
+        verbose_name = 'Слово поиска'
+        verbose_name_plural = 'Слова поиска'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('term', 'post'), name='unique_search_term'),
+        ]
+
+
+class UserCounters(models.Model):
+    """Счётчики пользователя, обновляются при записи."""
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name='counters',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    posts = models.PositiveIntegerField('Постов', default=0)
+    comments = models.PositiveIntegerField('Комментариев', default=0)
+    followers = models.PositiveIntegerField('Подписчиков', default=0)
+    following = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+
+class GroupCounters(models.Model):
+    """Счётчики группы, обновляются при записи."""
+    group = models.OneToOneField(
+        Group,
+        primary_key=True,
+        related_name='counters',
+        on_delete=models.CASCADE,
+        verbose_name='Группа'
+    )
+    posts = models.PositiveIntegerField('Постов', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики группы'
+        verbose_name_plural = 'Счётчики групп'
+
+
+class SiteCounters(models.Model):
+    """Счётчики всего сайта, одна строка; обновляются при записи."""
+    posts = models.PositiveIntegerField('Постов', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики сайта'
+        verbose_name_plural = 'Счётчики сайта'
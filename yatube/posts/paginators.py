@@ -0,0 +1,129 @@
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+NEXT = 'n'
+PREVIOUS = 'p'
+LAST = 'l'
+CURSOR_SEPARATOR = '|'
+
+
+def encode_cursor(direction, obj=None, date_field='pub_date'):
+    """Упаковывает ключ (дата, id) объекта в непрозрачный токен."""
+    if obj is None:
+        return encode_key(direction)
+    return encode_key(direction, getattr(obj, date_field), obj.pk)
+
+
+def encode_key(direction, date=None, pk=None):
+    """Токен для ключа (дата, id), например из строки values()."""
+    parts = [direction]
+    if date is not None:
+        parts += [date.isoformat(), str(pk)]
+    return urlsafe_base64_encode(force_bytes(CURSOR_SEPARATOR.join(parts)))
+
+
+def decode_cursor(token):
+    """Возвращает (направление, дата, id) или None для битого токена."""
+    try:
+        raw = urlsafe_base64_decode(token).decode()
+    except (ValueError, UnicodeDecodeError):
+        return None
+    direction, *key = raw.split(CURSOR_SEPARATOR)
+    if direction == LAST and not key:
+        return direction, None, None
+    if direction not in (NEXT, PREVIOUS) or len(key) != 2:
+        return None
+    date, pk = key
+    try:
+        date, pk = parse_datetime(date), int(pk)
+    except ValueError:
+        return None
+    if date is None:
+        return None
+    return direction, date, pk
+
+
+class CursorPage(Page):
+    """Страница keyset-пагинации: без номера и без COUNT(*)."""
+
+    def __init__(self, object_list, paginator,
+                 next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<CursorPage>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (дата, id), от новых записей к старым.
+
+    Переход по токенам ``?cursor=`` стоит одинаково на любой глубине
+    ленты, первая страница тоже берётся по курсору — без COUNT(*).
+    Страницы ``?page=N`` открываются только по старым ссылкам.
+    """
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 **kwargs):
+        self.date_field = date_field
+        super().__init__(
+            object_list.order_by(f'-{date_field}', '-id'), per_page, **kwargs)
+        self.last_cursor = encode_cursor(LAST)
+
+    def encode(self, direction, obj):
+        return encode_cursor(direction, obj, self.date_field)
+
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        page.previous_cursor = None
+        page.next_cursor = (self.encode(NEXT, page[-1])
+                            if page.has_next() else None)
+        return page
+
+    def get_cursor_page(self, token=None):
+        """Возвращает CursorPage; без токена или для битого — начало ленты."""
+        cursor = decode_cursor(token) if token else None
+        if cursor is None:
+            return self._fetch()
+        return self._fetch(*cursor)
+
+    def _fetch(self, direction=None, date=None, pk=None):
+        objects = self.object_list
+        if direction in (NEXT, PREVIOUS):
+            lookup = 'lt' if direction == NEXT else 'gt'
+            objects = objects.filter(
+                Q(**{f'{self.date_field}__{lookup}': date})
+                | Q(**{self.date_field: date, f'pk__{lookup}': pk}))
+        backward = direction in (PREVIOUS, LAST)
+        if backward:
+            objects = objects.reverse()
+        rows = list(objects[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backward:
+            if not has_more:
+                return self._fetch()
+            rows.reverse()
+            return CursorPage(
+                rows, self,
+                next_cursor=(self.encode(NEXT, rows[-1])
+                             if direction == PREVIOUS else None),
+                previous_cursor=self.encode(PREVIOUS, rows[0]),
+            )
+        return CursorPage(
+            rows, self,
+            next_cursor=self.encode(NEXT, rows[-1]) if has_more else None,
+            previous_cursor=(self.encode(PREVIOUS, rows[0])
+                             if direction == NEXT and rows else None),
+        )
@@ -0,0 +1,186 @@
+"""Полнотекстовый поиск по постам на инвертированном индексе.
+
+Каждое слово поста хранится строкой SearchTerm (слово, пост, число
+вхождений) и читается по уникальному индексу (term, post). Пост
+находится, если в нём есть все слова запроса; выше те, где редкие
+слова встречаются чаще (tf-idf). Результаты листаются по ключу
+(релевантность, id поста), без OFFSET и COUNT(*).
+"""
+import math
+import re
+from collections import Counter
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from . import counters
+from .models import Post, SearchTerm
+from .paginators import CURSOR_SEPARATOR, NEXT, PREVIOUS, CursorPage
+
+BATCH_SIZE = 1000
+MAX_TERM_LENGTH = 64
+TERM_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Слова текста в том виде, в котором они лежат в индексе."""
+    text = text.lower().replace('ё', 'е')
+    return [term[:MAX_TERM_LENGTH] for term in TERM_RE.findall(text)]
+
+
+def terms_of(post):
+    return [SearchTerm(term=term, post_id=post.pk, frequency=frequency)
+            for term, frequency in Counter(tokenize(post.text)).items()]
+
+
+def index_post(post):
+    """Перестраивает слова поста в индексе."""
+    SearchTerm.objects.filter(post_id=post.pk).delete()
+    SearchTerm.objects.bulk_create(terms_of(post))
+
+
+def rebuild():
+    """Строит индекс всех постов с нуля."""
+    posts = Post.objects.order_by('pk').only('text').iterator()
+    with transaction.atomic():
+        SearchTerm.objects.all().delete()
+        while True:
+            batch = [term for post in islice(posts, BATCH_SIZE)
+                     for term in terms_of(post)]
+            if not batch:
+                break
+            SearchTerm.objects.bulk_create(batch)
+
+
+def weights(terms):
+    """{слово: idf} по текущему индексу или None, если слова нет нигде.
+
+    Число постов берётся из счётчиков сайта, а не COUNT(*) по постам.
+    """
+    frequencies = dict(SearchTerm.objects
+                       .filter(term__in=terms)
+                       .order_by()
+                       .values_list('term')
+                       .annotate(posts=Count('pk')))
+    if len(frequencies) < len(terms):
+        return None
+    total = counters.site.get().posts
+    return {term: math.log(1 + total / posts)
+            for term, posts in frequencies.items()}
+
+
+def ranked(query, group=None, username=None, idf=None):
+    """Строки (post, score) постов со всеми словами запроса.
+
+    Отсортированы по убыванию релевантности, при равенстве — от новых
+    постов к старым. idf — веса слов из weights(); без них считаются
+    по текущему индексу.
+    """
+    terms = set(tokenize(query))
+    if idf is None and terms:
+        idf = weights(terms)
+    if not idf or set(idf) != terms:
+        return SearchTerm.objects.none().values('post')
+    hits = SearchTerm.objects.filter(term__in=terms)
+    if group is not None:
+        hits = hits.filter(post__group=group)
+    if username:
+        hits = hits.filter(post__author__username=username)
+    score = Sum(Case(
+        *(When(term=term, then=F('frequency') * Value(weight))
+          for term, weight in idf.items()),
+        output_field=FloatField(),
+    ))
+    return (hits
+            .order_by()
+            .values('post')
+            .annotate(matched=Count('pk'), score=score)
+            .filter(matched=len(terms))
+            .order_by('-score', '-post_id'))
+
+
+def search_ids(query):
+    """Подзапрос id постов со всеми словами запроса."""
+    return ranked(query).values('post')
+
+
+def encode_cursor(direction, row, idf):
+    """Токен ключа (score, id) вместе с весами слов первой страницы.
+
+    Пока листаются страницы, появляются новые посты и веса меняются;
+    со старыми весами следующие страницы считаются так же, как первая,
+    и ключ не пропускает и не повторяет результаты.
+    """
+    raw = CURSOR_SEPARATOR.join([
+        direction, repr(row['score']), str(row['post']),
+        *(f'{term}={weight!r}' for term, weight in sorted(idf.items())),
+    ])
+    return urlsafe_base64_encode(force_bytes(raw))
+
+
+def decode_cursor(token):
+    """Возвращает (направление, score, id, веса) или None для битого."""
+    try:
+        direction, score, pk, *terms = (
+            urlsafe_base64_decode(token).decode().split(CURSOR_SEPARATOR))
+        score, pk = float(score), int(pk)
+        idf = {term: float(weight) for term, weight
+               in (item.split('=') for item in terms)}
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if (direction not in (NEXT, PREVIOUS)
+            or not all(map(math.isfinite, [score, *idf.values()]))):
+        return None
+    return direction, score, pk, idf
+
+
+def search_page(query, per_page, token=None, group=None, username=None):
+    """CursorPage постов запроса; битый токен ведёт на первую страницу.
+
+    Посты достаются одним запросом for_feed(), у каждого есть score.
+    """
+    terms = set(tokenize(query))
+    cursor = decode_cursor(token) if token else None
+    if cursor is not None and set(cursor[3]) != terms:
+        cursor = None
+    if cursor is None:
+        idf = weights(terms) if terms else None
+    else:
+        idf = cursor[3]
+    direction = cursor and cursor[0]
+    rows = ranked(query, group, username, idf=idf or {})
+    if cursor is not None:
+        lookup = 'lt' if direction == NEXT else 'gt'
+        score, pk = cursor[1:3]
+        rows = rows.filter(
+            Q(**{f'score__{lookup}': score})
+            | Q(score=score, **{f'post_id__{lookup}': pk}))
+    if direction == PREVIOUS:
+        rows = rows.reverse()
+    rows = list(rows[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == PREVIOUS:
+        if not has_more:
+            return search_page(query, per_page, group=group,
+                               username=username)
+        rows.reverse()
+    posts = Post.objects.for_feed().in_bulk([row['post'] for row in rows])
+    results = []
+    for row in rows:
+        post = posts.get(row['post'])
+        if post is not None:
+            post.score = row['score']
+            results.append(post)
+    forward_more = has_more or direction == PREVIOUS
+    return CursorPage(
+        results, None,
+        next_cursor=(encode_cursor(NEXT, rows[-1], idf)
+                     if rows and forward_more else None),
+        previous_cursor=(encode_cursor(PREVIOUS, rows[0], idf)
+                         if rows and direction is not None
+                         and (direction == NEXT or has_more) else None),
+    )
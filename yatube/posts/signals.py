@@ -0,0 +1,163 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core import generations
+
+from . import counters, search, timeline
+from .models import Comment, Follow, Group, Post, User
+
+CARD_USER_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Post)
+def post_fan_out(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_backfill(sender, instance, created, **kwargs):
+    if created and not timeline.is_celebrity(instance.author):
+        timeline.backfill([instance.user_id], instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_prune(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+    followers = Follow.objects.filter(author_id=instance.author_id)
+    if followers.count() == settings.TIMELINE_FANOUT_LIMIT - 1:
+        # Автор перестал быть популярным: его посты больше не подмешиваются
+        # при чтении, поэтому раскладываем их по лентам подписчиков.
+        timeline.backfill(followers.values_list('user_id', flat=True),
+                          instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def post_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'text' in update_fields:
+        search.index_post(instance)
+
+
+@receiver(pre_save, sender=Post)
+def post_remember_group(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._saved_group_id = (Post.objects
+                                    .filter(pk=instance.pk)
+                                    .values_list('group_id', flat=True)
+                                    .first())
+
+
+@receiver(post_save, sender=Post)
+def post_count(sender, instance, created, **kwargs):
+    if created:
+        counters.site.change(posts=1)
+        counters.users.change(instance.author_id, posts=1)
+        if instance.group_id:
+            counters.groups.change(instance.group_id, posts=1)
+        return
+    saved_group_id = getattr(instance, '_saved_group_id', None)
+    if saved_group_id != instance.group_id:
+        if saved_group_id:
+            counters.groups.change(saved_group_id, posts=-1)
+        if instance.group_id:
+            counters.groups.change(instance.group_id, posts=1)
+
+
+@receiver(post_delete, sender=Post)
+def post_uncount(sender, instance, **kwargs):
+    counters.site.change(posts=-1)
+    counters.users.change(instance.author_id, posts=-1)
+    if instance.group_id:
+        counters.groups.change(instance.group_id, posts=-1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_count(sender, instance, created, **kwargs):
+    if created:
+        counters.users.change(instance.author_id, comments=1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_uncount(sender, instance, **kwargs):
+    counters.users.change(instance.author_id, comments=-1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_count(sender, instance, created, **kwargs):
+    if created:
+        counters.users.change(instance.author_id, followers=1)
+        counters.users.change(instance.user_id, following=1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_uncount(sender, instance, **kwargs):
+    counters.users.change(instance.author_id, followers=-1)
+    counters.users.change(instance.user_id, following=-1)
+
+
+@receiver(post_save, sender=Post)
+def post_card_bump(sender, instance, created, **kwargs):
+    if not created:
+        generations.bump_on_commit(f'post:{instance.pk}')
+
+
+@receiver(post_save, sender=User)
+def author_card_bump(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or CARD_USER_FIELDS & set(update_fields):
+        generations.bump_on_commit(f'author:{instance.pk}')
+
+
+@receiver(post_save, sender=Group)
+def group_card_bump(sender, instance, **kwargs):
+    generations.bump_on_commit(f'group:{instance.pk}')
+
+
+def bump_post_pages(post, *group_ids):
+    scopes = ['page:global', f'page:author:{post.author_id}',
+              f'page:post:{post.pk}']
+    scopes += [f'page:group:{group_id}' for group_id in group_ids
+               if group_id]
+    generations.bump_on_commit(*scopes)
+
+
+@receiver(post_save, sender=Post)
+def post_page_bump(sender, instance, **kwargs):
+    bump_post_pages(instance, instance.group_id,
+                    getattr(instance, '_saved_group_id', None))
+
+
+@receiver(post_delete, sender=Post)
+def post_page_delete_bump(sender, instance, **kwargs):
+    bump_post_pages(instance, instance.group_id)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_page_bump(sender, instance, **kwargs):
+    generations.bump_on_commit(f'page:post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_page_bump(sender, instance, **kwargs):
+    generations.bump_on_commit(f'page:author:{instance.author_id}',
+                               f'page:author:{instance.user_id}')
+
+
+@receiver(post_save, sender=User)
+def author_page_bump(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or CARD_USER_FIELDS & set(update_fields):
+        group_ids = (Post.objects
+                     .filter(author=instance, group__isnull=False)
+                     .order_by()
+                     .values_list('group_id', flat=True)
+                     .distinct())
+        generations.bump_on_commit(
+            'page:global', f'page:author:{instance.pk}',
+            *(f'page:group:{pk}' for pk in group_ids))
+
+
+@receiver(post_save, sender=Group)
+def group_page_bump(sender, instance, **kwargs):
+    generations.bump_on_commit('page:global', f'page:group:{instance.pk}')
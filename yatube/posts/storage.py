@@ -0,0 +1,81 @@
+"""Хранилище картинок постов, адресованное содержимым.
+
+Файл лежит под именем sha256 своего содержимого, разложенным по
+подкаталогам: ``posts/ab/cd/abcd….jpg``. Повторная загрузка тех же
+байтов не пишет новый файл, а получает имя существующего, поэтому и
+миниатюры sorl (их имена выводятся из имени исходника) готовятся
+один раз на содержимое.
+
+Один файл может принадлежать нескольким постам. Файлы, на которые
+не ссылается ни один пост, удаляет периодический ``thumbnails.sweep``
+(команда ``sweep_images``), а не удаление поста: иначе файл мог бы
+пропасть из-под загрузки, которая уже получила его имя, но ещё не
+сохранила пост.
+"""
+import hashlib
+import os
+import posixpath
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+TEMP_SUFFIX = '.tmp'
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    """Имя файла по хешу в каталоге исходного имени, с его расширением."""
+    directory, filename = posixpath.split(name)
+    extension = posixpath.splitext(filename)[1].lower()
+    shards = [digest[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH]
+              for level in range(SHARD_LEVELS)]
+    return posixpath.join(directory, *shards, digest + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, который кладёт файл по хешу содержимого."""
+
+    def _save(self, name, content):
+        name = hashed_name(name, content_hash(content))
+        if self.touch(name):
+            return name
+        # Файл пишется под временным именем и ставится на место жёсткой
+        # ссылкой. Ссылка не перезаписывает существующий файл: из двух
+        # одновременных загрузок одних байтов одна создаёт файл, другая
+        # получает его имя, и недописанным файл никто не видит.
+        temporary = super()._save(
+            f'{name}.{uuid.uuid4().hex}{TEMP_SUFFIX}', content)
+        try:
+            os.link(self.path(temporary), self.path(name))
+        except FileExistsError:
+            self.touch(name)
+        finally:
+            self.delete(temporary)
+        return name
+
+    def touch(self, name):
+        """Обновляет время изменения файла; False, если файла нет.
+
+        Свежий файл sweep не удаляет, пока загрузка сохраняет пост.
+        """
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def walk(self, directory):
+        """Имена всех файлов в directory и его подкаталогах."""
+        directories, files = self.listdir(directory)
+        for filename in files:
+            yield posixpath.join(directory, filename)
+        for subdirectory in directories:
+            yield from self.walk(posixpath.join(directory, subdirectory))
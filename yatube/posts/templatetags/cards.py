@@ -0,0 +1,42 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core import generations
+from posts import thumbnails
+
+register = template.Library()
+
+
+def card_scopes(post):
+    """Области кэша, от которых зависит карточка поста."""
+    scopes = [f'post:{post.pk}', f'author:{post.author_id}']
+    if post.group_id:
+        scopes.append(f'group:{post.group_id}')
+    return scopes
+
+
+@register.simple_tag
+def post_cards(posts, template_name):
+    """HTML карточек постов страницы: из кэша, рендерим только промахи."""
+    posts = list(posts)
+    versions = generations.get_many(
+        {scope for post in posts for scope in card_scopes(post)})
+    keys = [
+        ':'.join(['post_card', template_name, str(post.pk)]
+                 + [str(versions[scope]) for scope in card_scopes(post)])
+        for post in posts
+    ]
+    cards = cache.get_many(keys)
+    missing = {key: post for key, post in zip(keys, posts)
+               if key not in cards}
+    # Миниатюры нужны только рендерящимся карточкам: читаем их разом.
+    thumbnails.attach(missing.values())
+    for key, post in missing.items():
+        missing[key] = render_to_string(template_name, {'post': post})
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_TIMEOUT)
+        cards.update(missing)
+    return [mark_safe(cards[key]) for key in keys]
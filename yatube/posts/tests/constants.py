@@ -10,6 +10,7 @@ POST_DETAIL_URL_NAME = 'posts:post_detail'
 POST_CREATE_URL_NAME = 'posts:post_create'
 POST_EDIT_URL_NAME = 'posts:post_edit'
 COMMENTS_URL = 'posts:add_comment'
+FOLLOW_URL_NAME = 'posts:follow_index'
 
 INDEX_TEMPLATE = 'posts/index.html'
 GROUP_LIST_TEMPLATE = 'posts/group_list.html'
@@ -20,3 +21,14 @@ FOLLOW_TEMPLATE = 'posts/follow.html'
 
 POST_IN_PAGE = 10
 POST_IN_2PAGE = 3
+
+# Сколько SQL-запросов может сделать страница, включая сессию,
+# пользователя, точки сохранения транзакции запроса и поиск областей
+# кэша для ETag.
+QUERY_BUDGETS = {
+    INDEX_URL_NAME: 6,
+    GROUP_LIST_URL_NAME: 9,
+    PROFILE_URL_NAME: 10,
+    POST_DETAIL_URL_NAME: 8,
+    FOLLOW_URL_NAME: 7,
+}
@@ -0,0 +1,194 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import models
+from django.test import TestCase
+from django.utils import timezone
+
+from posts import benchmarks
+from posts.models import (Comment, Follow, Group, Post, SearchTerm,
+                          TimelineEntry, User)
+from posts.tests.constants import (
+    GROUP_DESCRIPTION,
+    GROUP_SLUG,
+    GROUP_TITLE,
+    POST_TEXT,
+)
+
+
+class ExportPostsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=GROUP_SLUG,
+            description=GROUP_DESCRIPTION,
+        )
+        cls.old_post = Post.objects.create(author=cls.author, text='Старый')
+        Post.objects.filter(pk=cls.old_post.pk).update(
+            pub_date=timezone.now() - timedelta(days=30))
+        cls.post = Post.objects.create(
+            author=cls.author, text=POST_TEXT, group=cls.group)
+        Comment.objects.create(post=cls.post, author=cls.reader, text='!')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def export(self, *args):
+        stdout = StringIO()
+        call_command('export_posts', *args, stdout=stdout, stderr=StringIO())
+        return stdout.getvalue()
+
+    def test_ndjson_contains_every_table(self):
+        """NDJSON по строке на запись каждой таблицы."""
+        records = [json.loads(line)
+                   for line in self.export().splitlines()]
+        models = [record['model'] for record in records]
+        self.assertEqual(models, ['group', 'post', 'post', 'comment',
+                                  'follow'])
+        self.assertEqual(records[2]['text'], POST_TEXT)
+
+    def test_since_skips_old_rows(self):
+        """--since отбрасывает старые посты."""
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        output = self.export('--models', 'post', '--since', since)
+        ids = [json.loads(line)['id'] for line in output.splitlines()]
+        self.assertEqual(ids, [self.post.pk])
+
+    def test_csv_to_directory(self):
+        """CSV пишется по файлу на таблицу."""
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.export('--format', 'csv', '--output', directory)
+        with open(f'{directory}/post.csv', encoding='utf-8') as stream:
+            rows = list(csv.DictReader(stream))
+        self.assertEqual([row['text'] for row in rows], ['Старый', POST_TEXT])
+
+    def test_csv_to_stdout_needs_one_table(self):
+        """CSV в stdout для нескольких таблиц — ошибка."""
+        with self.assertRaises(CommandError):
+            self.export('--format', 'csv')
+
+
+class RebuildTimelinesTest(TestCase):
+    def test_rebuild_fills_feeds_from_follows(self):
+        """Ленты раскладываются заново по текущим подпискам."""
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        stranger = User.objects.create_user(username='stranger')
+        post = Post.objects.create(author=author, text=POST_TEXT)
+        Follow.objects.create(user=reader, author=author)
+        TimelineEntry.objects.all().delete()
+        TimelineEntry.objects.create(
+            user=stranger, post=post, pub_date=post.pub_date)
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list('user', 'post')),
+            [(reader.pk, post.pk)])
+
+
+class SeedTest(TestCase):
+    def seed(self, *args):
+        call_command('seed', '--users', '30', '--groups', '3',
+                     '--posts', '60', '--comments', '40', '--follows', '4',
+                     '--batch-size', '25', *args, stdout=StringIO())
+
+    def test_seed_is_deterministic(self):
+        """Одинаковый --seed даёт одинаковые данные."""
+        self.seed('--seed', '7')
+        texts = list(Post.objects.order_by('pk').values_list(
+            'text', 'author_id', 'group_id', 'pub_date'))
+        follows = list(Follow.objects.order_by('pk').values_list(
+            'user_id', 'author_id'))
+        comments = list(Comment.objects.order_by('pk').values_list(
+            'post_id', 'created'))
+        for model in (Follow, Comment, Post, Group, User):
+            model.objects.all().delete()
+        self.seed('--seed', '7', '--no-derived')
+        self.assertEqual(list(Post.objects.order_by('pk').values_list(
+            'text', 'author_id', 'group_id', 'pub_date')), texts)
+        self.assertEqual(list(Follow.objects.order_by('pk').values_list(
+            'user_id', 'author_id')), follows)
+        self.assertEqual(list(Comment.objects.order_by('pk').values_list(
+            'post_id', 'created')), comments)
+
+    def test_seed_builds_derived_data(self):
+        """После заполнения готовы счётчики, ленты и индекс поиска."""
+        self.seed('--faker')
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(Comment.objects.count(), 40)
+        self.assertFalse(Follow.objects.filter(
+            user=models.F('author')).exists())
+        author = User.objects.filter(posts__isnull=False).first()
+        self.assertEqual(author.counters.posts, author.posts.count())
+        follow = Follow.objects.filter(author__posts__isnull=False).first()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=follow.user, post__author=follow.author).exists())
+        self.assertTrue(SearchTerm.objects.exists())
+        dates = Post.objects.aggregate(
+            first=models.Min('pub_date'), last=models.Max('pub_date'))
+        self.assertGreater(dates['last'] - dates['first'], timedelta(days=1))
+
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.report = os.path.join(self.folder, 'report.json')
+        self.baseline = os.path.join(self.folder, 'baseline.json')
+
+    def benchmark(self, *args):
+        call_command('benchmark', '--in-place', '--sizes', '30,60',
+                     '--repeat', '2', '--warmup', '0',
+                     '--output', self.report, '--baseline', self.baseline,
+                     *args, stdout=StringIO(), stderr=StringIO())
+        with open(self.report, encoding='utf-8') as stream:
+            return json.load(stream)
+
+    def test_report(self):
+        """Отчёт есть для каждого размера, сценария и режима кэша."""
+        report = self.benchmark('--save-baseline')
+        self.assertEqual(report['sizes'], [30, 60])
+        self.assertEqual(Post.objects.count(),
+                         60 + report['repeat'] + 1)
+        for size in ('30', '60'):
+            results = report['results'][size]
+            self.assertEqual(set(results), set(benchmarks.SCENARIOS))
+            self.assertEqual(set(results['index']), {'cold', 'warm'})
+            self.assertEqual(set(results['post_create']), {'write'})
+            cold = results['index']['cold']
+            self.assertGreater(cold['queries'], 0)
+            self.assertGreater(cold['memory'], 0)
+            self.assertLessEqual(cold['p50'], cold['p99'])
+        self.assertIn('cold', report['scaling']['index'])
+        with open(self.baseline, encoding='utf-8') as stream:
+            self.assertEqual(json.load(stream), report)
+
+    def test_site_cache_is_untouched(self):
+        """Замеры не чистят кэш сайта и не пишут в него."""
+        cache.clear()
+        cache.set('sentinel', 1)
+        self.benchmark()
+        self.assertEqual(cache.find_keys(''), ['sentinel'])
+
+    def test_compare(self):
+        """Лишний запрос и заметное замедление попадают в список."""
+        stats = {'p50': 10.0, 'p90': 12.0, 'p99': 15.0, 'max': 15.0,
+                 'queries': 5, 'memory': 1000}
+        baseline = {'sizes': [10], 'scaling': {},
+                    'results': {'10': {'index': {'cold': stats}}}}
+        noisy = dict(stats, p50=10.9, max=40.0)
+        report = dict(baseline, results={'10': {'index': {'cold': noisy}}})
+        self.assertEqual(benchmarks.compare(report, baseline, 0.05), [])
+        slow = dict(stats, p90=20.0, queries=6)
+        report = dict(baseline, results={'10': {'index': {'cold': slow}}})
+        self.assertEqual(len(benchmarks.compare(report, baseline, 0.25)), 2)
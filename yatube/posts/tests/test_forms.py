@@ -2,12 +2,15 @@ import shutil
 import tempfile
 
 from http import HTTPStatus
+from io import BytesIO
 
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
+from posts import images
 from posts.models import Post, Group, User, Comment
 from posts.tests.constants import (
     POST_CREATE_URL_NAME,
@@ -21,6 +24,8 @@ from posts.tests.constants import (
 )
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+EXIF_ORIENTATION = 0x0112
+EXIF_MAKE = 0x010F
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -87,7 +92,7 @@ class FormTest(TestCase):
         self.assertTrue(Post.objects.filter(
             text=self.post.text,
             group=self.group.id,
-            image='posts/small.gif'
+            image__regex=r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.gif$'
         ).exists()
         )
 
@@ -201,3 +206,96 @@ class CommentFormTest(TestCase):
         self.assertRedirects(response, redirect_url)
 
         self.assertEqual(Comment.objects.count(), comments_count)
+
+
+def camera_jpeg(size, orientation):
+    """JPEG как с камеры: EXIF с поворотом и комментарием."""
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = orientation
+    exif[EXIF_MAKE] = 'Camera'
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def animated_gif(size):
+    frames = [Image.new('RGB', size, color)
+              for color in ('red', 'green', 'blue')]
+    buffer = BytesIO()
+    frames[0].save(buffer, 'GIF', save_all=True, append_images=frames[1:],
+                   duration=[100, 200, 300], loop=0, comment=b'secret')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_MAX_SIDE=300)
+class ImageNormalizationTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='photographer')
+        self.client.force_login(self.user)
+
+    def test_upload_is_rotated_capped_and_stripped(self):
+        """Картинка повёрнута по EXIF, уменьшена и без метаданных."""
+        uploaded = SimpleUploadedFile(
+            'photo.jpg', camera_jpeg((600, 200), orientation=6),
+            content_type='image/jpeg')
+        self.client.post(reverse(POST_CREATE_URL_NAME),
+                         {'text': POST_TEXT, 'image': uploaded})
+        post = Post.objects.get(author=self.user)
+        self.assertEqual((post.image_width, post.image_height), (100, 300))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (100, 300))
+            self.assertEqual(len(image.getexif()), 0)
+
+    def test_animation_is_capped_and_stripped(self):
+        """У анимации уменьшены все кадры, метаданных нет, тайминг цел."""
+        data, size = images.normalize(animated_gif((600, 200)), 300, 85)
+        self.assertEqual(size, (300, 100))
+        with Image.open(BytesIO(data)) as image:
+            self.assertEqual(image.n_frames, 3)
+            self.assertNotIn('comment', image.info)
+            durations = []
+            for frame in range(image.n_frames):
+                image.seek(frame)
+                self.assertEqual(image.size, (300, 100))
+                durations.append(image.info['duration'])
+        self.assertEqual(durations, [100, 200, 300])
+
+    def test_static_gif_is_stripped(self):
+        """У обычного GIF нет комментария, прозрачность цела."""
+        buffer = BytesIO()
+        Image.new('P', (600, 200)).save(buffer, 'GIF', transparency=0,
+                                        comment=b'secret')
+        data, size = images.normalize(buffer.getvalue(), 300, 85)
+        self.assertEqual(size, (300, 100))
+        with Image.open(BytesIO(data)) as image:
+            self.assertNotIn('comment', image.info)
+            self.assertEqual(image.info['transparency'], 0)
+
+    def test_edit_without_new_image_keeps_size(self):
+        """Правка текста не трогает картинку и её размеры."""
+        post = Post.objects.create(author=self.user, text=POST_TEXT,
+                                   image_width=10, image_height=20)
+        self.client.post(
+            reverse(POST_EDIT_URL_NAME, kwargs={'post_id': post.pk}),
+            {'text': 'Новый текст'})
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Новый текст')
+        self.assertEqual((post.image_width, post.image_height), (10, 20))
+
+    @override_settings(IMAGE_QUEUE_TIMEOUT=0)
+    def test_full_queue_rejects_upload(self):
+        """Когда все места в пуле заняты, загрузка отклоняется."""
+        executor, slots = images.get_executor()
+        for _ in range(settings.IMAGE_QUEUE_SIZE):
+            slots.acquire()
+        try:
+            with self.assertRaises(images.Busy):
+                images.normalize_upload(camera_jpeg((10, 10), 1))
+        finally:
+            for _ in range(settings.IMAGE_QUEUE_SIZE):
+                slots.release()
@@ -0,0 +1,75 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.tests.constants import (
+    GROUP_DESCRIPTION,
+    GROUP_SLUG,
+    GROUP_TITLE,
+    POST_TEXT,
+    INDEX_URL_NAME,
+    GROUP_LIST_URL_NAME,
+    PROFILE_URL_NAME,
+    POST_DETAIL_URL_NAME,
+)
+
+FEED_TABLES = ('posts_post', 'posts_comment', 'posts_follow',
+               'posts_timelineentry')
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanTest(TestCase):
+    """Запросы лент читают по индексам, без полного скана и сортировки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=GROUP_SLUG,
+            description=GROUP_DESCRIPTION,
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text=POST_TEXT, group=cls.group)
+        Comment.objects.create(post=cls.post, author=cls.reader, text='!')
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+        cache.clear()
+
+    def captured_plans(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(url)
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if sql.startswith('SELECT') and any(
+                    f'FROM "{table}"' in sql for table in FEED_TABLES):
+                yield sql, explain(sql)
+
+    def test_views_use_indexes(self):
+        urls = (
+            reverse(INDEX_URL_NAME),
+            reverse(GROUP_LIST_URL_NAME, kwargs={'slug': GROUP_SLUG}),
+            reverse(PROFILE_URL_NAME, kwargs={'username': 'auth'}),
+            reverse(POST_DETAIL_URL_NAME, kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            for sql, plan in self.captured_plans(url):
+                with self.subTest(url=url, sql=sql):
+                    for step in plan:
+                        self.assertNotRegex(
+                            step, r'^SCAN (TABLE )?posts_\w+$', plan)
+                        self.assertNotIn(
+                            'USE TEMP B-TREE FOR ORDER BY', step, plan)
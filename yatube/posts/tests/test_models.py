@@ -1,7 +1,13 @@
+from io import StringIO
+from unittest import mock
+
 from django.test import TestCase
 from django.conf import settings
+from django.core.management import call_command
+from django.db import DatabaseError
 
-from posts.models import Group, Post, User
+from posts.models import (Comment, Follow, Group, GroupCounters, Post,
+                          SiteCounters, User, UserCounters)
 from posts.tests.constants import (
     GROUP_DESCRIPTION,
     GROUP_SLUG,
@@ -68,3 +74,70 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     self.post._meta.get_field(field).help_text, expected_value)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=GROUP_SLUG,
+            description=GROUP_DESCRIPTION,
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text=POST_TEXT, group=cls.group)
+        Post.objects.create(author=cls.author, text=POST_TEXT)
+        Comment.objects.create(post=cls.post, author=cls.reader, text='!')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def assertCounters(self, model, pk, **expected):
+        counters = model.objects.get(pk=pk)
+        for name, value in expected.items():
+            with self.subTest(counter=name):
+                self.assertEqual(getattr(counters, name), value)
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются вместе с постами, комментариями, подписками."""
+        self.assertCounters(UserCounters, self.author.pk,
+                            posts=2, comments=0, followers=1, following=0)
+        self.assertCounters(UserCounters, self.reader.pk,
+                            posts=0, comments=1, followers=0, following=1)
+        self.assertCounters(GroupCounters, self.group.pk, posts=1)
+        self.assertCounters(SiteCounters, 1, posts=2)
+        self.assertCounters(SiteCounters, 1, posts=2)
+
+        self.post.group = None
+        self.post.save()
+        self.assertCounters(GroupCounters, self.group.pk, posts=0)
+
+        self.post.delete()
+        Follow.objects.all().delete()
+        self.assertCounters(UserCounters, self.author.pk,
+                            posts=1, followers=0)
+        self.assertCounters(SiteCounters, 1, posts=1)
+        self.assertCounters(UserCounters, self.reader.pk,
+                            comments=0, following=0)
+
+    def test_failed_counter_rolls_back_write(self):
+        """Если счётчик не сдвинулся, запись тоже не сохраняется."""
+        post = Post.objects.get(group=self.group)
+        with mock.patch('posts.counters.users.change',
+                        side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                Comment.objects.create(
+                    post=post, author=self.reader, text='?')
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertCounters(UserCounters, self.reader.pk, comments=1)
+
+    def test_rebuild_counters(self):
+        """Команда rebuild_counters исправляет разъехавшиеся счётчики."""
+        UserCounters.objects.update(posts=100, followers=100)
+        GroupCounters.objects.all().delete()
+        SiteCounters.objects.update(posts=100)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertCounters(UserCounters, self.author.pk,
+                            posts=2, followers=1)
+        self.assertCounters(GroupCounters, self.group.pk, posts=1)
+        self.assertCounters(SiteCounters, 1, posts=2)
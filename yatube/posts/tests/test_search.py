@@ -0,0 +1,113 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts import search
+from posts.models import Group, Post, SearchTerm, User
+from posts.tests.constants import (
+    GROUP_DESCRIPTION,
+    GROUP_SLUG,
+    GROUP_TITLE,
+    POST_IN_PAGE,
+)
+
+SEARCH_URL = reverse('posts:search')
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='finder')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=GROUP_SLUG,
+            description=GROUP_DESCRIPTION,
+        )
+
+    def found(self, **params):
+        response = self.client.get(SEARCH_URL, params)
+        return list(response.context['page_obj'])
+
+    def test_results_are_ranked(self):
+        """Находятся посты со всеми словами, чаще встречающиеся — выше."""
+        once = Post.objects.create(author=self.user, text='Ёжик в тумане')
+        twice = Post.objects.create(
+            author=self.user, text='Ежик, ежик, где твой туман? В тумане')
+        Post.objects.create(author=self.user, text='Просто ежик')
+        self.assertEqual(self.found(q='ежик тумане'), [twice, once])
+
+    def test_index_follows_edit_and_delete(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = Post.objects.create(author=self.user, text='Старое слово')
+        post.text = 'Новое слово'
+        post.save()
+        self.assertEqual(self.found(q='старое'), [])
+        self.assertEqual(self.found(q='новое'), [post])
+        post.delete()
+        self.assertFalse(SearchTerm.objects.exists())
+
+    def test_filters_by_group_and_author(self):
+        """Результаты фильтруются по группе и автору."""
+        in_group = Post.objects.create(
+            author=self.user, text='Котики', group=self.group)
+        by_other = Post.objects.create(author=self.other, text='Котики')
+        self.assertEqual(self.found(q='котики', group=GROUP_SLUG),
+                         [in_group])
+        self.assertEqual(self.found(q='котики', author='other'), [by_other])
+        self.assertEqual(self.found(q='котики', author='nobody'), [])
+
+    def test_keyset_pagination(self):
+        """Страницы результатов листаются курсорами вперёд и назад."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text='Страница') for _ in range(12))
+        search.rebuild()
+        first = search.search_page('страница', POST_IN_PAGE)
+        self.assertEqual(len(first), POST_IN_PAGE)
+        self.assertFalse(first.has_previous())
+        second = search.search_page('страница', POST_IN_PAGE,
+                                    first.next_cursor)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(second.has_next())
+        self.assertEqual(
+            set(first.object_list) & set(second.object_list), set())
+        back = search.search_page('страница', POST_IN_PAGE,
+                                  second.previous_cursor)
+        self.assertEqual(back.object_list, first.object_list)
+        broken = search.search_page('страница', POST_IN_PAGE, 'broken')
+        self.assertEqual(broken.object_list, first.object_list)
+
+    def test_new_posts_do_not_shift_pages(self):
+        """Новые посты между страницами не сдвигают ключ курсора."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text='Страница') for _ in range(12))
+        search.rebuild()
+        first = search.search_page('страница', POST_IN_PAGE)
+        for _ in range(5):
+            Post.objects.create(author=self.other, text='Другое')
+        second = search.search_page('страница', POST_IN_PAGE,
+                                    first.next_cursor)
+        self.assertEqual(len(second), 2)
+        self.assertEqual(
+            set(first.object_list) & set(second.object_list), set())
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по тому же индексу."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+        post = Post.objects.create(author=self.user, text='Ёлка')
+        Post.objects.create(author=self.user, text='Ёлочка')
+        client = Client()
+        client.force_login(admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'елка'})
+        self.assertEqual(list(response.context['cl'].result_list), [post])
+
+    def test_rebuild_command(self):
+        """Команда rebuild_search строит индекс заново."""
+        post = Post.objects.create(author=self.user, text='Потерянный')
+        SearchTerm.objects.all().delete()
+        call_command('rebuild_search', stdout=StringIO())
+        self.assertEqual(self.found(q='потерянный'), [post])
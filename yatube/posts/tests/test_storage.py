@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts.models import Post, User
+from posts.tests.constants import POST_CREATE_URL_NAME, POST_TEXT
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def png(color):
+    buffer = BytesIO()
+    Image.new('RGB', (4, 4), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def stored_files():
+    return sorted(
+        os.path.relpath(os.path.join(root, name), TEMP_MEDIA_ROOT)
+        for root, dirs, files in os.walk(TEMP_MEDIA_ROOT)
+        for name in files)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='author')
+        self.client.force_login(self.user)
+
+    def upload(self, name, content):
+        self.client.post(reverse(POST_CREATE_URL_NAME), {
+            'text': POST_TEXT,
+            'image': SimpleUploadedFile(name, content, 'image/png'),
+        })
+
+    def test_same_content_is_stored_once(self):
+        """Одинаковые картинки под разными именами — один файл."""
+        self.upload('meme.png', png('red'))
+        self.upload('meme-copy.PNG', png('red'))
+        self.upload('other.png', png('blue'))
+        names = list(Post.objects.order_by('pk').values_list(
+            'image', flat=True))
+        self.assertEqual(names[0], names[1])
+        self.assertNotEqual(names[0], names[2])
+        self.assertRegex(names[0], r'^posts/(\w\w)/(\w\w)/\1\2\w{60}\.png$')
+        self.assertEqual(len(stored_files()), 2)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageSweepTest(TestCase):
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, TEMP_MEDIA_ROOT, ignore_errors=True)
+        self.user = User.objects.create_user(username='author')
+        self.storage = Post._meta.get_field('image').storage
+        self.name = self.storage.save('posts/meme.png',
+                                      ContentFile(png('red')))
+        self.posts = [
+            Post.objects.create(author=self.user, text=POST_TEXT,
+                                image=self.name)
+            for _ in range(2)]
+
+    def sweep(self, grace=0):
+        call_command('sweep_images', grace=grace, stdout=StringIO())
+
+    def test_file_lives_while_referenced(self):
+        """Файл удаляется, только когда на него не ссылается ни один пост."""
+        self.posts[0].delete()
+        self.sweep()
+        self.assertEqual(stored_files(), [self.name])
+        self.posts[1].delete()
+        self.assertEqual(stored_files(), [self.name])
+        self.sweep()
+        self.assertEqual(stored_files(), [])
+
+    def test_replaced_image_is_swept(self):
+        """Заменённая картинка удаляется, если больше никому не нужна."""
+        other = self.storage.save('posts/other.png', ContentFile(png('blue')))
+        for post in self.posts:
+            post.image = other
+            post.save()
+        self.sweep()
+        self.assertEqual(stored_files(), [other])
+
+    def test_recently_reused_file_survives(self):
+        """Повторная загрузка освежает файл, и sweep его не трогает."""
+        Post.objects.all().delete()
+        path = self.storage.path(self.name)
+        os.utime(path, (0, 0))
+        self.assertEqual(
+            self.storage.save('posts/again.png', ContentFile(png('red'))),
+            self.name)
+        self.sweep(grace=60)
+        self.assertEqual(stored_files(), [self.name])
+
+    def test_concurrent_upload_of_same_bytes_gets_same_name(self):
+        """Если файл появился во время записи, берётся его имя."""
+        real_link = os.link
+
+        def link_after_rival(source, target):
+            real_link(source, target)
+            return real_link(source, target)
+
+        with mock.patch('posts.storage.os.link', link_after_rival):
+            name = self.storage.save('posts/race.png',
+                                     ContentFile(png('green')))
+        self.assertRegex(name, r'/\w{64}\.png$')
+        self.assertEqual(stored_files(), sorted([self.name, name]))
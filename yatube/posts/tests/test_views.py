@@ -1,15 +1,24 @@
 import shutil
 import tempfile
+from unittest import skipUnless
 
-from django.test import TestCase, Client, override_settings
+from django.test import (
+    TestCase, TransactionTestCase, Client, override_settings)
 from django.urls import reverse
 from django import forms
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
 
-
-from posts.models import Post, Group, User, Follow
+from core import generations
+from posts import thumbnails
+from posts.views import COMMENTS_PER_PAGE
+from posts.models import Post, Group, User, Follow, TimelineEntry, Comment
 
 from posts.tests.constants import (
     POST_IN_PAGE,
@@ -24,6 +33,8 @@ from posts.tests.constants import (
     POST_DETAIL_URL_NAME,
     POST_CREATE_URL_NAME,
     POST_EDIT_URL_NAME,
+    FOLLOW_URL_NAME,
+    QUERY_BUDGETS,
 )
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -160,6 +171,9 @@ class PostPaginatorTest(TestCase):
         }
         cache.clear()
 
+    def setUp(self):
+        cache.clear()
+
     def test_first_page_contains_ten_records(self):
         """Тестируем пагинатор на 1й стр."""
         for template, reverse_name in self.urls_list.items():
@@ -172,6 +186,45 @@ class PostPaginatorTest(TestCase):
             response = self.client.get(reverse_name + '?page=2')
             self.assertEqual(len(response.context['page_obj']), POST_IN_2PAGE)
 
+    def test_cursor_pages(self):
+        """Курсоры ведут вперёд и назад по всем лентам."""
+        for template, reverse_name in self.urls_list.items():
+            cache.clear()
+            first = self.client.get(reverse_name).context['page_obj']
+            response = self.client.get(
+                reverse_name + f'?cursor={first.next_cursor}')
+            second = response.context['page_obj']
+            self.assertEqual(len(second), POST_IN_2PAGE)
+            self.assertFalse(second.has_next())
+            self.assertFalse(set(first) & set(second))
+            response = self.client.get(
+                reverse_name + f'?cursor={second.previous_cursor}')
+            self.assertEqual(
+                list(response.context['page_obj']), list(first))
+
+    def test_cursor_page_without_count_and_offset(self):
+        """Первая страница и страница по курсору без COUNT и OFFSET."""
+        url = self.urls_list[INDEX_URL_NAME]
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get(url).context['page_obj']
+            response = self.client.get(url + f'?cursor={first.next_cursor}')
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'])
+            self.assertNotIn('OFFSET', query['sql'])
+        self.assertContains(response, f'href="{url}">Первая<')
+        self.assertNotContains(response, '?page=')
+
+    def test_last_and_broken_cursor(self):
+        """Последняя страница и битый курсор."""
+        url = self.urls_list[PROFILE_URL_NAME]
+        first = self.client.get(url).context['page_obj']
+        response = self.client.get(
+            url + f'?cursor={first.paginator.last_cursor}')
+        self.assertEqual(len(response.context['page_obj']), POST_IN_PAGE)
+        self.assertFalse(response.context['page_obj'].has_next())
+        response = self.client.get(url + '?cursor=broken')
+        self.assertEqual(list(response.context['page_obj']), list(first))
+
 
 class PostGroupInTest(TestCase):
     @classmethod
@@ -290,3 +343,387 @@ class FollowTest(TestCase):
             reverse('posts:follow_index'))
         new_post_unfollower = response_unfollower.context['page_obj']
         self.assertNotIn(new_post_follower, new_post_unfollower)
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.old_post = Post.objects.create(author=cls.author, text='Старый')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def get_feed(self):
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка дополняет ленту, отписка чистит её."""
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'writer'}))
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=self.old_post).exists())
+        new_post = Post.objects.create(author=self.author, text='Новый')
+        self.assertEqual(self.get_feed(), [new_post, self.old_post])
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': 'writer'}))
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.get_feed(), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_celebrity_posts_are_read_on_demand(self):
+        """Посты популярного автора не раскладываются, но видны в ленте."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый')
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.get_feed(), [new_post, self.old_post])
+
+
+class QueryBudgetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='budget')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=GROUP_SLUG,
+            description=GROUP_DESCRIPTION,
+        )
+        Follow.objects.create(user=cls.reader, author=cls.user)
+        for _ in range(POST_IN_PAGE + 2):
+            Post.objects.create(
+                author=cls.user, text=POST_TEXT, group=cls.group)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+        cache.clear()
+
+    def test_views_fit_query_budget(self):
+        """Число запросов страницы не зависит от числа постов на ней."""
+        post = Post.objects.first()
+        urls = {
+            INDEX_URL_NAME: reverse(INDEX_URL_NAME),
+            GROUP_LIST_URL_NAME: reverse(
+                GROUP_LIST_URL_NAME, kwargs={'slug': GROUP_SLUG}),
+            PROFILE_URL_NAME: reverse(
+                PROFILE_URL_NAME, kwargs={'username': 'budget'}),
+            POST_DETAIL_URL_NAME: reverse(
+                POST_DETAIL_URL_NAME, kwargs={'post_id': post.pk}),
+            FOLLOW_URL_NAME: reverse(FOLLOW_URL_NAME),
+        }
+        for name, url in urls.items():
+            with self.subTest(view=name):
+                with CaptureQueriesContext(connection) as queries:
+                    self.authorized_client.get(url)
+                self.assertLessEqual(len(queries), QUERY_BUDGETS[name],
+                                     [q['sql'] for q in queries])
+
+
+class PostCardCacheTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='cards', first_name='Старое', last_name='Имя')
+        self.post = Post.objects.create(
+            author=self.user, text='Старый текст')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def get_feed(self):
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        return response.content.decode()
+
+    def test_card_is_cached_until_post_edit(self):
+        """Карточка берётся из кэша, пока пост не отредактирован."""
+        Follow.objects.create(user=self.user, author=self.user)
+        self.assertIn('Старый текст', self.get_feed())
+        Post.objects.filter(pk=self.post.pk).update(text='Новый текст')
+        self.assertIn('Старый текст', self.get_feed())
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertIn('Новый текст', self.get_feed())
+
+    def test_card_is_reset_after_commit(self):
+        """До COMMIT правки читается старая карточка, после — новая."""
+        Follow.objects.create(user=self.user, author=self.user)
+        self.assertIn('Старый текст', self.get_feed())
+        with transaction.atomic():
+            self.post.text = 'Новый текст'
+            self.post.save()
+            self.assertIn('Старый текст', self.get_feed())
+        self.assertIn('Новый текст', self.get_feed())
+
+    def test_card_is_rerendered_after_author_rename(self):
+        """Смена имени автора сбрасывает его карточки."""
+        Follow.objects.create(user=self.user, author=self.user)
+        self.assertIn('Старое Имя', self.get_feed())
+        self.user.first_name = 'Новое'
+        self.user.save()
+        self.assertIn('Новое Имя', self.get_feed())
+
+
+class PageCacheTest(TransactionTestCase):
+    """Поколения сбрасываются после COMMIT, поэтому без обёртки TestCase."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='pages')
+        self.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=GROUP_SLUG,
+            description=GROUP_DESCRIPTION,
+        )
+        self.other_group = Group.objects.create(
+            title=GROUP_TITLE, slug='other', description=GROUP_DESCRIPTION)
+        self.post = Post.objects.create(
+            author=self.user, text=POST_TEXT, group=self.group)
+        cache.clear()
+
+    def assertCached(self, url, cached=True):
+        response = self.client.get(url)
+        self.assertEqual(response.context is None, cached, url)
+        return response
+
+    def test_index_is_cached_until_new_post(self):
+        """Главная кэшируется до появления нового поста."""
+        url = reverse(INDEX_URL_NAME)
+        self.assertCached(url, cached=False)
+        self.assertCached(url)
+        Post.objects.create(author=self.user, text='Новый пост')
+        response = self.assertCached(url, cached=False)
+        self.assertContains(response, 'Новый пост')
+
+    def test_group_page_depends_only_on_its_group(self):
+        """Пост в другой группе не сбрасывает страницу группы."""
+        url = reverse(GROUP_LIST_URL_NAME, kwargs={'slug': GROUP_SLUG})
+        self.assertCached(url, cached=False)
+        Post.objects.create(
+            author=self.user, text=POST_TEXT, group=self.other_group)
+        self.assertCached(url)
+        Post.objects.create(author=self.user, text=POST_TEXT, group=self.group)
+        self.assertCached(url, cached=False)
+
+    def test_post_detail_is_reset_by_comment(self):
+        """Новый комментарий сбрасывает страницу поста."""
+        url = reverse(POST_DETAIL_URL_NAME, kwargs={'post_id': self.post.pk})
+        self.assertCached(url, cached=False)
+        self.assertCached(url)
+        Comment.objects.create(post=self.post, author=self.user, text='!')
+        self.assertCached(url, cached=False)
+
+    def test_only_known_params_are_cached(self):
+        """Чужие параметры и битый курсор не заводят записей в кэше."""
+        url = reverse(INDEX_URL_NAME)
+        for query in ('?x=1', '?cursor=broken', '?page=1&page=2'):
+            with self.subTest(query=query):
+                self.assertCached(url + query, cached=False)
+                self.assertCached(url + query, cached=False)
+        self.assertCached(url + '?page=1', cached=False)
+        self.assertCached(url + '?page=1')
+
+    def test_pages_are_reset_after_commit(self):
+        """До COMMIT поколение страниц не меняется, после — сброшено."""
+        url = reverse(INDEX_URL_NAME)
+        self.assertCached(url, cached=False)
+        before = generations.get_many(['page:global'])
+        with transaction.atomic():
+            Post.objects.create(author=self.user, text='Новый пост')
+            self.assertEqual(generations.get_many(['page:global']), before)
+        self.assertNotEqual(generations.get_many(['page:global']), before)
+        self.assertCached(url, cached=False)
+
+    def test_authorized_user_is_not_served_from_cache(self):
+        """Авторизованному пользователю страницы не кэшируются."""
+        self.client.force_login(self.user)
+        url = reverse(INDEX_URL_NAME)
+        self.assertCached(url, cached=False)
+        self.assertCached(url, cached=False)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='thumbs')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text=POST_TEXT,
+            image=SimpleUploadedFile(
+                name='thumb.gif',
+                content=(
+                    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+                    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+                    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+                    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+                    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+                    b'\x0A\x00\x3B'
+                ),
+                content_type='image/gif',
+            ),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_detail(self):
+        return self.client.get(reverse(
+            POST_DETAIL_URL_NAME, kwargs={'post_id': self.post.pk}))
+
+    def test_page_shows_placeholder_until_thumbnail_is_ready(self):
+        """Пока миниатюры нет, страница показывает заглушку."""
+        response = self.get_detail()
+        self.assertContains(response, settings.THUMBNAIL_DUMMY_SOURCE)
+        self.assertNotContains(response, settings.MEDIA_URL + 'cache/')
+
+    @skipUnless(hasattr(Image, 'ANTIALIAS'),
+                'sorl-thumbnail 12.7 масштабирует только с Pillow < 10')
+    def test_generated_thumbnail_replaces_placeholder(self):
+        """Готовая миниатюра сбрасывает кэш страницы и заменяет заглушку."""
+        self.get_detail()
+        thumbnails.generate(self.post.image.name)
+        response = self.get_detail()
+        self.assertContains(response, settings.MEDIA_URL + 'cache/')
+        self.assertNotContains(response, settings.THUMBNAIL_DUMMY_SOURCE)
+
+    def test_attach_reads_thumbnails_without_queries(self):
+        """Миниатюры всех постов читаются из кэша, без запросов к БД."""
+        posts = [self.post, Post(author=self.user, text=POST_TEXT)]
+        with CaptureQueriesContext(connection) as queries:
+            thumbnails.attach(posts)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(set(posts[0].thumbnails),
+                         set(settings.POST_THUMBNAILS))
+        self.assertEqual(posts[0].thumbnails['card'].url,
+                         settings.THUMBNAIL_DUMMY_SOURCE)
+        self.assertEqual(posts[1].thumbnails, {})
+
+    def mark_thumbnails_ready(self):
+        """Записывает в KVStore все варианты, как это сделал бы пул."""
+        backend = thumbnails.backend
+        source = ImageFile(self.post.image)
+        for variant in thumbnails.variants():
+            name = backend._get_thumbnail_filename(
+                source, variant.geometry,
+                backend.full_options(source, variant.options))
+            image_file = ImageFile(name, default.storage)
+            image_file.set_size(
+                [int(side) for side in variant.geometry.split('x')])
+            default.kvstore.set(image_file)
+
+    def test_ready_thumbnails_have_srcset_per_format(self):
+        """Готовые миниатюры отдаются srcset'ами WebP и запасного JPEG."""
+        self.mark_thumbnails_ready()
+        [post] = thumbnails.attach([self.post])
+        picture = post.thumbnails['card']
+        self.assertEqual((picture.width, picture.height), (200, 200))
+        self.assertTrue(picture.url.endswith('.jpg'))
+        self.assertEqual(
+            [width.split()[-1] for width in picture.srcset.split(', ')],
+            ['100w', '200w', '400w'])
+        [source] = picture.sources
+        self.assertEqual(source['type'], 'image/webp')
+        self.assertIn('.webp 400w', source['srcset'])
+        response = self.get_detail()
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, 'sizes="200px"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_cache_kvstore_roundtrip(self):
+        """Метаданные миниатюр хранятся в кэше и ищутся по префиксу."""
+        image_file = ImageFile('cache/ready.jpg')
+        image_file.set_size((200, 100))
+        default.kvstore.set(image_file)
+        found = default.kvstore.get_many([image_file])
+        self.assertEqual(found[image_file.key].size, [200, 100])
+        self.assertIn(image_file.key, list(default.kvstore._find_keys()))
+        default.kvstore.delete(image_file)
+        self.assertIsNone(default.kvstore.get(image_file))
+
+
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='commenter')
+        cls.post = Post.objects.create(author=cls.user, text=POST_TEXT)
+        for number in range(COMMENTS_PER_PAGE + 5):
+            Comment.objects.create(
+                post=cls.post, author=cls.user, text=f'Комментарий {number}')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_detail_shows_first_page_of_comments(self):
+        """На странице поста только первая страница новых комментариев."""
+        response = self.client.get(
+            reverse(POST_DETAIL_URL_NAME, kwargs={'post_id': self.post.pk}))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        self.assertEqual(comments[0].text,
+                         f'Комментарий {COMMENTS_PER_PAGE + 4}')
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, comments.next_cursor)
+
+    def test_fragment_loads_older_comments(self):
+        """Фрагмент по курсору отдаёт следующие комментарии."""
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        first = self.client.get(url).context['comments']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'cursor': first.next_cursor})
+        comments = response.context['comments']
+        self.assertEqual([comment.text for comment in comments],
+                         [f'Комментарий {number}'
+                          for number in reversed(range(5))])
+        self.assertFalse(comments.has_next())
+        self.assertLessEqual(len(queries), QUERY_BUDGETS[POST_DETAIL_URL_NAME])
+
+
+class ConditionalGetTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='validators')
+        self.post = Post.objects.create(author=self.user, text=POST_TEXT)
+        cache.clear()
+
+    def test_repeat_request_gets_not_modified(self):
+        """Повтор с ETag или Last-Modified получает 304 без запросов лент."""
+        url = reverse(POST_DETAIL_URL_NAME, kwargs={'post_id': self.post.pk})
+        response = self.client.get(url)
+        validators = {
+            'HTTP_IF_NONE_MATCH': response['ETag'],
+            'HTTP_IF_MODIFIED_SINCE': response['Last-Modified'],
+        }
+        for header, value in validators.items():
+            with self.subTest(header=header):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, **{header: value})
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(any('posts_comment' in query['sql']
+                                     for query in queries))
+
+    def test_change_invalidates_etag(self):
+        """Новый пост меняет ETag главной."""
+        url = reverse(INDEX_URL_NAME)
+        etag = self.client.get(url)['ETag']
+        Post.objects.create(author=self.user, text='Новый пост')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_user(self):
+        """Авторизованный получает свой ETag и не получает Last-Modified."""
+        url = reverse(PROFILE_URL_NAME, kwargs={'username': 'validators'})
+        anonymous = self.client.get(url)
+        self.client.force_login(self.user)
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=anonymous['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
@@ -0,0 +1,321 @@
+"""Миниатюры картинок постов готовятся в фоне, а не при первом показе.
+
+Размеры описаны в ``settings.POST_THUMBNAILS``; каждый готовится
+в масштабах ``POST_THUMBNAIL_SCALES`` и форматах
+``POST_THUMBNAIL_FORMATS``. Перед рендером страница вызывает
+``attach(posts)``: одно чтение KVStore раскладывает по постам
+``Picture`` каждого размера (``post.thumbnails``) для ``<picture>``
+с ``srcset``. Пока готовы не все варианты, на месте картинки заглушка
+(``THUMBNAIL_DUMMY_SOURCE``), а картинка ставится в очередь пула
+потоков. Пул строит все варианты и сбрасывает кэш карточек и страниц
+постов с этой картинкой.
+
+``BackgroundThumbnailBackend`` делает то же для ``{% thumbnail %}``,
+``CacheKVStore`` хранит метаданные миниатюр в кэше Django вместо
+таблицы ``thumbnail_kvstore``.
+
+Картинка может быть общей для нескольких постов (posts.storage):
+``sweep`` удаляет с миниатюрами картинки, на которые давно не
+ссылается ни один пост.
+"""
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import (DummyImageFile, ImageFile,
+                                   deserialize_image_file)
+from sorl.thumbnail.kvstores.base import KVStoreBase, add_prefix
+
+from core import generations
+
+from . import signals
+from .storage import TEMP_SUFFIX
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+}
+
+# Сколько имён файлов sweep сверяет с постами одним запросом.
+SWEEP_BATCH_SIZE = 500
+
+Variant = namedtuple('Variant', 'size format scale geometry options')
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+class CacheKVStore(KVStoreBase):
+    """KVStore sorl-thumbnail поверх кэша Django, без таблицы в БД.
+
+    Вытесненная из кэша запись не теряет миниатюру: бэкенд покажет
+    заглушку, а пул заново запишет метаданные уже готового файла.
+    """
+
+    def get_many(self, image_files):
+        """Записи для нескольких файлов одним чтением: {key: ImageFile}."""
+        keys = {add_prefix(image_file.key): image_file.key
+                for image_file in image_files}
+        found = cache.get_many(list(keys))
+        return {keys[key]: deserialize_image_file(value)
+                for key, value in found.items() if value}
+
+    def _get_raw(self, key):
+        return cache.get(key)
+
+    def _set_raw(self, key, value):
+        cache.set(key, value, None)
+
+    def _delete_raw(self, *keys):
+        cache.delete_many(keys)
+
+    def _find_keys_raw(self, prefix):
+        find_keys = getattr(cache, 'find_keys', None)
+        if find_keys is None:
+            raise NotImplementedError(
+                'Кэш не умеет искать ключи по префиксу.')
+        return find_keys(prefix)
+
+
+class BackgroundThumbnailBackend(ThumbnailBackend):
+    """Отдаёт готовые миниатюры, недостающие заказывает в фоне."""
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        return self.get_many([(file_, geometry_string, options)])[0]
+
+    def get_many(self, requests):
+        """Миниатюры для списка (файл, размер, опции) одним чтением KVStore."""
+        thumbnails = []
+        for file_, geometry_string, options in requests:
+            source = ImageFile(file_)
+            name = self._get_thumbnail_filename(
+                source, geometry_string, self.full_options(source, options))
+            thumbnails.append((source, ImageFile(name, default.storage)))
+        get_many = getattr(default.kvstore, 'get_many', None)
+        if get_many is None:
+            found = {thumbnail.key: default.kvstore.get(thumbnail)
+                     for source, thumbnail in thumbnails}
+        else:
+            found = get_many([thumbnail for source, thumbnail in thumbnails])
+        ready = []
+        for (source, thumbnail), (file_, geometry_string, options) in zip(
+                thumbnails, requests):
+            image_file = found.get(thumbnail.key)
+            if image_file is None:
+                enqueue(source.name)
+                image_file = DummyImageFile(geometry_string)
+            ready.append(image_file)
+        return ready
+
+    def full_options(self, source, options):
+        """Опции с умолчаниями, как их дополняет ThumbnailBackend."""
+        options = dict(options)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return options
+
+
+backend = BackgroundThumbnailBackend()
+
+
+def variants():
+    """Все миниатюры одной картинки: размер × масштаб × формат."""
+    for size, (geometry, options, sizes) in settings.POST_THUMBNAILS.items():
+        width, height = (int(side) for side in geometry.split('x'))
+        for scale in settings.POST_THUMBNAIL_SCALES:
+            scaled_options = dict(options)
+            if scale > 1:
+                # Для плотных экранов исходник не растягиваем.
+                scaled_options['upscale'] = False
+            for image_format in settings.POST_THUMBNAIL_FORMATS:
+                yield Variant(
+                    size, image_format, scale,
+                    f'{round(width * scale)}x{round(height * scale)}',
+                    dict(scaled_options, format=image_format))
+
+
+class Picture:
+    """Миниатюры одного размера картинки для ``<picture>``.
+
+    ``url``, ``width`` и ``height`` — у миниатюры масштаба 1 в запасном
+    формате (последнем в POST_THUMBNAIL_FORMATS), она же ``src``
+    у ``<img>``. ``sources`` — по ``<source>`` на остальные форматы.
+    Пока готовы не все варианты, srcset пустой, а ``src`` — заглушка
+    или то, что уже готово.
+    """
+
+    def __init__(self, main, sizes, sources=(), srcset=''):
+        self.main = main
+        self.sizes = sizes
+        self.sources = list(sources)
+        self.srcset = srcset
+
+    def __bool__(self):
+        return bool(self.main)
+
+    @property
+    def url(self):
+        return self.main.url
+
+    @property
+    def width(self):
+        return self.main.width
+
+    @property
+    def height(self):
+        return self.main.height
+
+
+def srcset(files):
+    """Строка srcset: по одному файлу на ширину, от узких к широким."""
+    by_width = {image_file.width: image_file.url for image_file in files}
+    return ', '.join(f'{by_width[width]} {width}w'
+                     for width in sorted(by_width))
+
+
+def picture(size, found):
+    """Picture размера из пар (Variant, ImageFile) одной картинки."""
+    fallback = settings.POST_THUMBNAIL_FORMATS[-1]
+    main = next(image_file for variant, image_file in found
+                if variant.format == fallback and variant.scale == 1)
+    sizes = settings.POST_THUMBNAILS[size][2]
+    if any(isinstance(image_file, DummyImageFile)
+           for variant, image_file in found):
+        return Picture(main, sizes)
+    by_format = {}
+    for variant, image_file in found:
+        by_format.setdefault(variant.format, []).append(image_file)
+    sources = [{'type': MIME_TYPES[image_format],
+                'srcset': srcset(by_format[image_format])}
+               for image_format in settings.POST_THUMBNAIL_FORMATS[:-1]]
+    return Picture(main, sizes, sources, srcset(by_format[fallback]))
+
+
+def attach(posts):
+    """Раскладывает по постам Picture всех размеров: post.thumbnails."""
+    posts = list(posts)
+    all_variants = list(variants())
+    with_image = [post for post in posts if post.image]
+    found = iter(backend.get_many([
+        (post.image, variant.geometry, variant.options)
+        for post in with_image
+        for variant in all_variants
+    ]))
+    for post in posts:
+        post.thumbnails = {}
+    for post in with_image:
+        files = [(variant, next(found)) for variant in all_variants]
+        post.thumbnails = {
+            size: picture(size, [(variant, image_file)
+                                 for variant, image_file in files
+                                 if variant.size == size])
+            for size in settings.POST_THUMBNAILS
+        }
+    return posts
+
+
+def enqueue(name):
+    """Ставит картинку в очередь после фиксации текущей транзакции."""
+    transaction.on_commit(lambda: _submit(name))
+
+
+def _submit(name):
+    global _executor
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    _executor.submit(_run, name)
+
+
+def _run(name):
+    try:
+        generate(name)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры %s', name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+        connections.close_all()
+
+
+def source_file(name):
+    """Картинка поста в хранилище поля: от него зависят ключи миниатюр."""
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def generate(name):
+    """Строит все размеры миниатюр картинки и сбрасывает кэш её постов."""
+    generator = ThumbnailBackend()
+    source = source_file(name)
+    for variant in variants():
+        generator.get_thumbnail(source, variant.geometry, **variant.options)
+    for post in Post.objects.filter(image=name).only(
+            'author_id', 'group_id'):
+        generations.bump(f'post:{post.pk}')
+        signals.bump_post_pages(post, post.group_id)
+
+
+def sweep(grace):
+    """Удаляет картинки без постов, не тронутые дольше grace секунд.
+
+    Возвращает число удалённых файлов. Свежие файлы пропускаются:
+    загрузка, которая получила имя существующего файла, обновляет его
+    время изменения, а её пост может быть ещё не сохранён.
+    """
+    field = Post._meta.get_field('image')
+    storage = field.storage
+    deadline = time.time() - grace
+    names = storage.walk(field.upload_to.rstrip('/'))
+    removed = 0
+    while True:
+        batch = list(islice(names, SWEEP_BATCH_SIZE))
+        if not batch:
+            return removed
+        stale = [name for name in batch
+                 if os.stat(storage.path(name)).st_mtime < deadline]
+        used = set(Post.objects
+                   .filter(image__in=stale)
+                   .values_list('image', flat=True))
+        for name in stale:
+            if name in used:
+                continue
+            try:
+                if name.endswith(TEMP_SUFFIX):
+                    storage.delete(name)
+                else:
+                    backend.delete(source_file(name))
+            except Exception:
+                logger.exception('Не удалось удалить картинку %s', name)
+            else:
+                removed += 1
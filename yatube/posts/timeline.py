@@ -0,0 +1,98 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Follow, Post, TimelineEntry
+
+BATCH_SIZE = 1000
+
+
+def is_celebrity(author):
+    """Автор с большим числом подписчиков раздаётся при чтении."""
+    return (author.following.count()
+            >= settings.TIMELINE_FANOUT_LIMIT)
+
+
+def followed_celebrities(user):
+    """Id авторов из подписок пользователя, которых читаем без раздачи."""
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    return list(Follow.objects
+                .filter(user=user, author__counters__followers__gte=limit)
+                .values_list('author', flat=True))
+
+
+def insert(entries):
+    """Записывает записи лент пачками, не собирая их все в памяти.
+
+    Размер одного INSERT внутри пачки выбирает сам Django по
+    ограничениям базы.
+    """
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, BATCH_SIZE))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_celebrity(post.author):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    insert(TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+           for user_id in followers.iterator())
+
+
+def backfill(user_ids, author_id):
+    """Добавляет в ленты читателей уже опубликованные посты автора."""
+    posts = (Post.objects
+             .filter(author_id=author_id)
+             .values_list('pk', 'pub_date'))
+    insert(TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+           for user_id in user_ids
+           for pk, pub_date in posts.iterator())
+
+
+def rebuild():
+    """Раскладывает заново ленты всех подписчиков, кроме популярных авторов."""
+    authors = list(Follow.objects
+                   .order_by()
+                   .values('author_id')
+                   .annotate(followers=Count('pk'))
+                   .filter(followers__lt=settings.TIMELINE_FANOUT_LIMIT)
+                   .values_list('author_id', flat=True))
+    with transaction.atomic():
+        TimelineEntry.objects.all().delete()
+        for author_id in authors:
+            backfill(Follow.objects
+                     .filter(author_id=author_id)
+                     .values_list('user_id', flat=True),
+                     author_id)
+
+
+def prune(user_id, author_id):
+    """Убирает посты автора из ленты отписавшегося читателя."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def follow_feed(user):
+    """Посты ленты подписок.
+
+    Обычный случай — одно чтение по индексу (user, -pub_date) таблицы
+    TimelineEntry. Посты популярных авторов в неё не раскладываются
+    и подмешиваются отдельным условием.
+    """
+    celebrities = followed_celebrities(user)
+    if not celebrities:
+        return (Post.objects
+                .filter(timeline_entries__user=user)
+                .annotate(feed_date=F('timeline_entries__pub_date')))
+    entries = TimelineEntry.objects.filter(user=user).values('post')
+    return (Post.objects
+            .filter(Q(pk__in=entries) | Q(author__in=celebrities))
+            .annotate(feed_date=F('pub_date')))
@@ -1,23 +1,67 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
 
-from .models import Post, Group, User, Follow
-from .forms import PostForm, CommentForm
+from core.decorators import cache_anonymous_page, conditional_page
+
+from .models import Post, Group, User, Follow, Comment
+from . import counters, thumbnails
+from .forms import PostForm, CommentForm, SearchForm
+from .paginators import CursorPaginator, decode_cursor
+from .search import search_page
+from .timeline import follow_feed
 
 POST_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+# Параметры, которые читают ленты и комментарии, и их проверка для ключа
+# кэша страниц.
+CURSOR_PARAMS = {'cursor': decode_cursor}
+FEED_PARAMS = {'page': str.isdigit, **CURSOR_PARAMS}
+
+
+def index_scopes():
+    return ['page:global']
+
+
+def group_scopes(slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'id', flat=True).first()
+    return group_id and [f'page:group:{group_id}']
+
 
+def profile_scopes(username):
+    author_id = User.objects.filter(username=username).values_list(
+        'id', flat=True).first()
+    return author_id and [f'page:author:{author_id}']
 
-def get_page(request, posts):
-    paginator = Paginator(posts, POST_PER_PAGE)
+
+def post_scopes(post_id):
+    post = Post.objects.filter(pk=post_id).values(
+        'author_id', 'group_id').first()
+    if post is None:
+        return None
+    scopes = [f'page:post:{post_id}', f'page:author:{post["author_id"]}']
+    if post['group_id']:
+        scopes.append(f'page:group:{post["group_id"]}')
+    return scopes
+
+
+def get_page(request, posts, date_field='pub_date', numbered=False):
+    """Страница ленты по курсору; ?page=N — только для старых ссылок.
+
+    numbered — первая страница тоже с номером, через COUNT(*).
+    """
+    paginator = CursorPaginator(posts, POST_PER_PAGE, date_field=date_field)
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    cursor = request.GET.get('cursor')
+    if page_number is not None or numbered and not cursor:
+        return paginator.get_page(page_number)
+    return paginator.get_cursor_page(cursor)
 
 
-@cache_page(20)
+@conditional_page(index_scopes)
+@cache_anonymous_page(index_scopes, FEED_PARAMS)
 def index(request):
-    posts = Post.objects.all()
+    posts = Post.objects.for_feed()
     page_obj = get_page(request, posts)
     context = {
         'page_obj': page_obj,
@@ -25,20 +69,25 @@ def index(request):
     return render(request, 'posts/index.html', context)
 
 
+@conditional_page(group_scopes)
+@cache_anonymous_page(group_scopes, FEED_PARAMS)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group)
+    posts = Post.objects.for_feed().filter(group=group)
     page_obj = get_page(request, posts)
     context = {
         'group': group,
+        'group_counters': counters.groups.get(group.pk),
         'page_obj': page_obj,
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional_page(profile_scopes)
+@cache_anonymous_page(profile_scopes, FEED_PARAMS)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
+    posts = Post.objects.for_feed().filter(author=author)
     page_obj = get_page(request, posts)
     following = (request.user.is_authenticated
                  and Follow.objects.filter(
@@ -46,23 +95,50 @@ def profile(request, username):
                      author=author).exists())
     context = {
         'author': author,
+        'author_counters': counters.users.get(author.pk),
         'page_obj': page_obj,
         'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@conditional_page(post_scopes)
+@cache_anonymous_page(post_scopes, CURSOR_PARAMS)
 def post_detail(request, post_id):
     post = get_object_or_404(
-        Post.objects.select_related('author'), id=post_id)
-    comments = post.comments.all()
+        Post.objects.select_related('author', 'group'), id=post_id)
+    thumbnails.attach([post])
+    comments = get_comments(request, post.pk)
     form = CommentForm()
     context = {'post': post,
+               'author_counters': counters.users.get(post.author_id),
                'form': form,
                'comments': comments}
     return render(request, 'posts/post_detail.html', context)
 
 
+def get_comments(request, post_id):
+    """Страница комментариев поста, от новых к старым, по курсору."""
+    comments = (Comment.objects
+                .filter(post_id=post_id)
+                .select_related('author')
+                .only('text', 'created', 'post', 'author__username'))
+    paginator = CursorPaginator(
+        comments, COMMENTS_PER_PAGE, date_field='created')
+    return paginator.get_cursor_page(request.GET.get('cursor'))
+
+
+@conditional_page(post_scopes)
+@cache_anonymous_page(post_scopes, CURSOR_PARAMS)
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), id=post_id)
+    context = {
+        'post': post,
+        'comments': get_comments(request, post_id),
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -88,6 +164,8 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if post.image:
+            thumbnails.enqueue(post.image.name)
         return redirect('posts:profile', request.user.username)
 
     return render(request, 'posts/create_post.html', context)
@@ -114,6 +192,8 @@ def post_edit(request, post_id):
             post = form.save(commit=False)
             post.autor = request.user
             post.save()
+            if 'image' in form.changed_data and post.image:
+                thumbnails.enqueue(post.image.name)
             return redirect('posts:post_detail', post_id=post_id)
 
         return render(request, 'posts/create_post.html', context)
@@ -123,12 +203,32 @@ def post_edit(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page = get_page(request, posts)
+    posts = follow_feed(request.user).for_feed()
+    # Лента подписок своя у каждого, и COUNT(*) идёт по индексу ленты
+    # одного пользователя, поэтому первая страница здесь — обычный Page.
+    page = get_page(request, posts, date_field='feed_date', numbered=True)
     context = {'page_obj': page}
     return render(request, 'posts/follow.html', context)
 
 
+def search(request):
+    form = SearchForm(request.GET or None)
+    page_obj = None
+    if form.is_valid():
+        page_obj = search_page(form.cleaned_data['q'], POST_PER_PAGE,
+                               request.GET.get('cursor'),
+                               group=form.cleaned_data['group'],
+                               username=form.cleaned_data['author'])
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    context = {
+        'form': form,
+        'page_obj': page_obj,
+        'query_string': query.urlencode(),
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
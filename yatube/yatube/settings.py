@@ -10,7 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -38,10 +42,15 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.StaticFilesMiddleware',
+    'core.middleware.GZipMiddleware',
+    'core.middleware.ServerTimingMiddleware',
+    'core.middleware.QueryInspectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,12 +62,21 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if not DEBUG:
+    # В бою шаблон компилируется один раз на процесс; прогревает их
+    # core.warmup из wsgi.py.
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader',
+                         TEMPLATE_LOADERS)]
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -77,6 +95,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Запись модели и обновление её счётчиков и лент в одной транзакции.
+        'ATOMIC_REQUESTS': True,
     }
 }
 
@@ -113,6 +133,16 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
+if not DEBUG:
+    # Имена с хешем содержимого и .gz рядом; нужен collectstatic.
+    STATICFILES_STORAGE = (
+        'core.staticfiles.CompressedManifestStaticFilesStorage')
+# Собранную статику отдаёт core.middleware.StaticFilesMiddleware, если
+# перед приложением нет веб-сервера. Файлы без хеша в имени клиент
+# кэширует на STATIC_MAX_AGE секунд.
+SERVE_STATIC = not DEBUG
+STATIC_MAX_AGE = 60 * 60
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -127,6 +157,116 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.TwoTierCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'L1_MAX_ENTRIES': 1000,
+            'SYNC_INTERVAL': 0.5,
+        },
     }
 }
+
+# Авторы, у которых подписчиков не меньше этого числа, не раскладывают
+# посты по лентам подписчиков: их посты подмешиваются при чтении ленты.
+TIMELINE_FANOUT_LIMIT = 1000
+
+# Сколько секунд хранится отрендеренная карточка поста. Устаревшие
+# карточки не читаются и без этого: их ключи содержат поколения.
+POST_CARD_TIMEOUT = 60 * 60 * 24
+
+# Страницы лент для анонимов хранятся, пока их не сбросят сигналы.
+PAGE_CACHE_TIMEOUT = None
+
+# Миниатюры картинок постов готовит пул потоков (posts.thumbnails),
+# пока их нет — шаблоны показывают заглушку.
+THUMBNAIL_BACKEND = 'posts.thumbnails.BackgroundThumbnailBackend'
+THUMBNAIL_KVSTORE = 'posts.thumbnails.CacheKVStore'
+THUMBNAIL_DUMMY_SOURCE = STATIC_URL + 'img/placeholder.svg'
+THUMBNAIL_WORKERS = 2
+# Загруженные картинки обрабатывает пул процессов (posts.images):
+# не больше IMAGE_QUEUE_SIZE картинок сразу, остальные ждут места
+# IMAGE_QUEUE_TIMEOUT секунд и получают ошибку формы.
+IMAGE_MAX_SIDE = 2048
+IMAGE_QUALITY = 85
+IMAGE_WORKERS = 2
+IMAGE_QUEUE_SIZE = 8
+IMAGE_QUEUE_TIMEOUT = 5
+IMAGE_PROCESS_TIMEOUT = 30
+# Картинки без постов удаляет команда sweep_images (по расписанию), если
+# файл не трогали дольше IMAGE_SWEEP_GRACE секунд.
+IMAGE_SWEEP_GRACE = 60 * 60
+# Размеры, которые шаблоны берут из post.thumbnails: геометрия,
+# опции sorl и атрибут sizes — ширина картинки на странице.
+POST_THUMBNAILS = {
+    'card': ('200x200', {'crop': 'center'}, '200px'),
+    'wide': ('960x339', {'crop': 'center', 'upscale': True},
+             '(max-width: 960px) 100vw, 960px'),
+}
+# Каждый размер готовится в этих масштабах для srcset и в этих
+# форматах: последний — запасной для <img>, остальные идут в <source>.
+POST_THUMBNAIL_SCALES = (0.5, 1, 2)
+POST_THUMBNAIL_FORMATS = ('WEBP', 'JPEG')
+
+# Заголовок Server-Timing с временем SQL, шаблонов, кэша и миниатюр;
+# сотрудникам с ?timing=1 — та же таблица внизу страницы.
+SERVER_TIMING = True
+
+# Сжатие HTML и других текстовых ответов (core.middleware.GZipMiddleware):
+# уровень 1–9, больше — меньше трафика и больше CPU; 0 — не сжимать.
+# Ответы короче GZIP_MIN_LENGTH байт отдаются как есть.
+GZIP_LEVEL = 6
+GZIP_MIN_LENGTH = 200
+
+# wsgi.py прогревает воркер (core.warmup) до первого запроса.
+WARMUP_ON_START = not DEBUG
+
+# Лог запросов дольше SLOW_QUERY_MS (core.queries). Он дешёвый: место
+# запроса ищется, только когда запрос уже оказался медленным.
+SLOW_QUERY_LOG = True
+SLOW_QUERY_MS = 100
+# Поиск N+1: место ищется для каждого запроса, поэтому только при
+# разработке. В строгом режиме N+1 — исключение, а не запись в лог.
+QUERY_INSPECTOR = DEBUG
+NPLUSONE_LIMIT = 5
+NPLUSONE_STRICT = False
+
+# Тесты (manage.py test и pytest) идут в строгом режиме поиска N+1 и
+# с кэшем во временном каталоге, чтобы не читать и не засорять кэш
+# сайта.
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+if TESTING:
+    QUERY_INSPECTOR = True
+    NPLUSONE_STRICT = True
+    TEST_CACHE_DIR = tempfile.mkdtemp(prefix='yatube-cache-')
+    atexit.register(shutil.rmtree, TEST_CACHE_DIR, ignore_errors=True)
+    for params in CACHES.values():
+        params['LOCATION'] = os.path.join(
+            TEST_CACHE_DIR, os.path.basename(params['LOCATION']))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(BASE_DIR, 'slow_queries.log'),
+            'maxBytes': 5 * 1024 * 1024,
+            'backupCount': 3,
+            'encoding': 'utf-8',
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'core.queries.slow': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Отдельная база для manage.py benchmark и базовый отчёт, с которым
+# сверяются замеры.
+BENCHMARK_DATABASE = os.path.join(BASE_DIR, 'benchmark.sqlite3')
+BENCHMARK_BASELINE = os.path.join(BASE_DIR, 'benchmarks', 'baseline.json')